@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def spec_cost_matrix(hire_rows, laptop_rows):
+    # Squared spec distance between every hire and every laptop, hires x laptops, in one pass:
+    # ||h - l||^2 = ||h||^2 - 2hl + ||l||^2
+    hire_rows = np.asarray(hire_rows, dtype=np.float64)
+    laptop_rows = np.asarray(laptop_rows, dtype=np.float64)
+    cost = np.einsum('ij,ij->i', hire_rows, hire_rows)[:, None] - 2.0 * (hire_rows @ laptop_rows.T) + np.einsum('ij,ij->i', laptop_rows, laptop_rows)[None, :]
+    return np.maximum(cost, 0.0, out=cost)
+
+
+def _greedy_assignment(cost):
+    # Cheapest pairs first, each hire and laptop used once; not optimal, but never worse than
+    # assigning hires one at a time in request order
+    order = np.argsort(cost, axis=None, kind='stable')
+    rows, cols = np.unravel_index(order, cost.shape)
+    used_rows = np.zeros(cost.shape[0], dtype=bool)
+    used_cols = np.zeros(cost.shape[1], dtype=bool)
+    pairs = []
+    limit = min(cost.shape)
+    for row, col in zip(rows, cols):
+        if not used_rows[row] and not used_cols[col]:
+            used_rows[row] = used_cols[col] = True
+            pairs.append((row, col))
+            if len(pairs) == limit:
+                break
+    pairs.sort()
+    return np.array([row for row, _ in pairs], dtype=np.intp), np.array([col for _, col in pairs], dtype=np.intp)
+
+
+def allocate(cost):
+    # Minimum-total-cost matching of hires (rows) to laptops (columns). With more hires than
+    # laptops, the hires left out are those whose exclusion costs least. Returns (rows, cols).
+    if cost.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    try:
+        # Imported on first use: scipy.optimize takes longer to import than the rest of the app
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:  # scipy is optional; fall back to a greedy matching
+        return _greedy_assignment(cost)
+    return linear_sum_assignment(cost)
@@ -1,43 +1,214 @@
-from flask import Flask, request, jsonify
-import pickle
-import pandas as pd
+from flask import Blueprint, Flask, current_app, request, jsonify, url_for
 from bson import ObjectId
-from config import get_db
+from pymongo import ReturnDocument, UpdateOne
+import config
+from cache import DocumentCache, ChangeFollower
+from instrumentation import span, instrument_flask
+from metrics import REGISTRY
+from listing import RESOURCES, list_params, fetch_page, utilization, export_rows, dumps
+from startup import Warmup
 from datetime import datetime
-import numpy as np
-from sklearn.linear_model import LinearRegression
+import functools
 import logging
+import os
+import warnings
 
-app = Flask(__name__)
+# Routes are registered on the app built by create_app(). Module state below is filled in lazily:
+# importing this module loads neither numpy/scikit-learn nor the model, and opens no connection.
+api = Blueprint('api', __name__)
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Set by the startup components registered below (connect_database, load_model, ...)
+db = None
+model_store = None
+predict_batcher = None
+laptop_index = None
+forecast_cache = None
+grouped_forecast_cache = None
+job_worker = None
+cache_followers = []
 
-# Load the model and encoders
-try:
-    with open('laptop_recommendation_model.pkl', 'rb') as file:
-        model, label_encoders, id_mapping = pickle.load(file)
-except Exception as e:
-    logging.error(f"Error loading model and encoders: {e}")
-    raise
+def laptop_summary(laptop):
+    return {
+        "serialNumber": laptop['serialNumber'],
+        "model": laptop['model'],
+        "brand": laptop['brand'],
+        "specifications": laptop['specifications']
+    }
 
-# Load the demand forecasting model
-def load_demand_model():
-    try:
-        with open('laptop_demand_model.pkl', 'rb') as file:
-            demand_model = pickle.load(file)
-        return demand_model
-    except Exception as e:
-        logging.error(f"Error loading demand forecasting model: {e}")
-        return None
+# Number of nearest Available laptops to consider when onboarding
+ONBOARD_CANDIDATES = 5
+
+# Largest list of requirements accepted by /api/recommendations/batch
+RECOMMENDATION_BATCH_MAX_SIZE = 1000
+
+# Cohort onboarding: largest cohort per request, and how often to re-solve for hires whose
+# planned laptop was claimed by a concurrent request
+COHORT_MAX_SIZE = 5000
+COHORT_MAX_ROUNDS = 3
+
+# Read-through caches for Laptop (by _id) and Employee (by name) documents
+laptop_cache = DocumentCache(maxsize=config.CACHE_SIZE, ttl=config.CACHE_TTL)
+employee_cache = DocumentCache(maxsize=config.CACHE_SIZE, ttl=config.CACHE_TTL)
+
+def get_laptop(laptop_id):
+    return laptop_cache.get_or_load(laptop_id, lambda: db.Laptops.find_one({"_id": laptop_id}))
+
+def get_employee_by_name(name):
+    return employee_cache.get_or_load(name, lambda: db.Employees.find_one({"name": name}))
+
+def set_laptop_status(laptop_id, status):
+    # Write-through for a laptop status change already applied in MongoDB
+    laptop_cache.update(laptop_id, {"status": status})
+    laptop_index.set_status(laptop_id, status)
+
+def claim_laptop(laptop_id, status):
+    # Atomically move a laptop from Available to status in one round trip.
+    # Returns the updated document, or None if the laptop was not Available.
+    laptop = db.Laptops.find_one_and_update(
+        {"_id": laptop_id, "status": "Available"},
+        {"$set": {"status": status}},
+        return_document=ReturnDocument.AFTER
+    )
+    if laptop is not None:
+        laptop_cache.put(laptop_id, laptop)
+        laptop_index.set_status(laptop_id, status)
+    return laptop
+
+def release_laptop(laptop_id, status):
+    # Undo a claim whose follow-up insert failed
+    db.Laptops.update_one({"_id": laptop_id, "status": status}, {"$set": {"status": "Available"}})
+    set_laptop_status(laptop_id, "Available")
 
-# Connect to MongoDB
-db = get_db()
+def resync_laptops(laptop_ids):
+    # Refresh cache and index entries for laptops whose claim failed, in one query
+    found = set()
+    for laptop in db.Laptops.find({"_id": {"$in": laptop_ids}}):
+        found.add(laptop["_id"])
+        laptop_cache.put(laptop["_id"], laptop)
+        laptop_index.upsert(laptop)
+    for laptop_id in laptop_ids:
+        if laptop_id not in found:
+            laptop_cache.invalidate(laptop_id)
+            laptop_index.remove(laptop_id)
+
+def connect_database():
+    # Fails fast when MongoDB is unreachable; the warm-up retries with backoff
+    global db
+    database = config.get_db()
+    database.command("ping")
+    db = database
+
+def load_model():
+    # The memory-mapped artifact named by CURRENT, else the legacy pickle (which needs scikit-learn).
+    # Requests read model_store.current() once, so hot reloads never mix two model versions.
+    global model_store, predict_batcher
+    from model_artifact import ModelStore, load_pickle
+    from batcher import PredictBatcher
+    
+    # Models are fitted on DataFrames but served with plain arrays
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    
+    store = ModelStore(config.MODEL_ARTIFACT_DIR)
+    if not store.reload():
+        store.set(load_pickle(config.MODEL_PICKLE_PATH))
+    
+    # Concurrent recommendation and onboarding requests share one predict call per batch
+    batcher = PredictBatcher(store, max_batch=config.PREDICT_BATCH_MAX_ROWS, window=config.PREDICT_BATCH_WINDOW_MS / 1000.0)
+    REGISTRY.add_histogram('lamp_predict_batch_size', "Rows per batched predict call", batcher.batch_sizes)
+    REGISTRY.add_histogram('lamp_predict_queue_wait_seconds', "Time a row waits for its batch to run", batcher.queue_wait)
+    model_store, predict_batcher = store, batcher
+
+def load_laptop_index():
+    # In-memory spec index of all laptops, partitioned by status and kept current on every status change
+    global laptop_index, cache_followers
+    from laptop_index import LaptopIndex
+    laptop_index = LaptopIndex.from_collection(db.Laptops, model_store.current().encoder)
+    
+    def rebuild_laptop_index(artifact):
+        # A new model version may encode specs differently; the index carries its own encoder until replaced
+        global laptop_index
+        laptop_index = LaptopIndex.from_collection(db.Laptops, artifact.encoder)
+    
+    model_store.on_swap = rebuild_laptop_index
+    if config.MODEL_WATCH_INTERVAL > 0:
+        model_store.watch(config.MODEL_WATCH_INTERVAL)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=model_store.restart_after_fork)
+    
+    # Follow Laptops writes from other processes so cached documents and the index stay coherent. The
+    # index relies on it, so it always runs; when polling, every laptop's status is scanned, cached or not.
+    cache_followers = [
+        ChangeFollower(
+            db.Laptops, laptop_cache, poll_interval=config.CACHE_POLL_INTERVAL, poll_fields=("status",),
+            on_change=lambda laptop: laptop_index.upsert(laptop), on_delete=lambda laptop_id: laptop_index.remove(laptop_id)
+        ).start()
+    ]
+    if config.CACHE_FOLLOW_CHANGES:
+        cache_followers.append(ChangeFollower(db.Employees, employee_cache, key_field="name", poll_interval=config.CACHE_POLL_INTERVAL).start())
+    if hasattr(os, "register_at_fork"):
+        for follower in cache_followers:
+            os.register_at_fork(after_in_child=follower.restart_after_fork)
 
-@app.route('/api/recommendations', methods=['POST'])
+def load_forecasting():
+    global forecast_cache, grouped_forecast_cache
+    from demand_forecast import DemandModelCache, ForecastCache, GroupedForecastCache
+    
+    # Demand forecasting model, reloaded only when the pickle changes, and the last computed forecast
+    forecast_cache = ForecastCache(DemandModelCache('laptop_demand_model.pkl'))
+    
+    # Grouped forecasts for ?group=&horizon=, fitted on request from a cached demand history
+    grouped_forecast_cache = GroupedForecastCache()
+
+def start_jobs():
+    # Reservation expiry, retraining and forecast precomputation, never on the request path
+    global job_worker
+    from jobs import JobWorker, add_default_jobs
+    worker = JobWorker(db, max_workers=config.JOB_WORKERS)
+    if config.BACKGROUND_JOBS:
+        add_default_jobs(
+            worker, config, model_store, forecast_cache, grouped_forecast_cache,
+            on_released=resync_laptops, sync_index=lambda laptops: laptop_index.sync(laptops)
+        ).start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=worker.restart_after_fork)
+    job_worker = worker
+
+warmup = Warmup()
+warmup.register('database', connect_database)
+warmup.register('model', load_model)
+warmup.register('laptopIndex', load_laptop_index, requires=('database', 'model'))
+warmup.register('forecasting', load_forecasting)
+warmup.register('jobs', start_jobs, requires=('laptopIndex', 'forecasting'))
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=warmup.restart_after_fork)
+
+# Components a request can be served without; /api/ready reports the rest
+READY_COMPONENTS = ('database', 'model', 'laptopIndex')
+
+def requires(*components):
+    # Load what a view needs on its first request; an immediate 503 while a dependency is loading
+    # or still unreachable
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                warmup.ensure(*components, wait=False)
+            except Exception as e:
+                logging.error(f"Error starting {', '.join(components)}: {e}")
+                response = jsonify({"error": f"Service is starting: {str(e)}"})
+                response.status_code = 503
+                response.headers['Retry-After'] = '5'
+                return response
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@api.route('/api/recommendations', methods=['POST'])
+@requires('laptopIndex')
 def recommend_laptop():
     try:
-        data = request.get_json()
+        with span('parse'):
+            data = request.get_json()
         
         # Get laptop requirements from the request
         requirements = {
@@ -46,38 +217,9 @@ def recommend_laptop():
             'storage': data.get('storage', '')
         }
         
-        # Convert requirements to DataFrame
-        requirements_df = pd.DataFrame([requirements])
-        
-        # Replace empty strings with NaN
-        requirements_df.replace('', np.nan, inplace=True)
-        
-        # Ensure that 'cpu', 'ram', and 'storage' are numeric
-        requirements_df['cpu'] = pd.to_numeric(requirements_df['cpu'], errors='coerce')
-        requirements_df['ram'] = pd.to_numeric(requirements_df['ram'], errors='coerce')
-        requirements_df['storage'] = pd.to_numeric(requirements_df['storage'], errors='coerce')
-        
-        # Fill NaN with 0 or another appropriate value
-        requirements_df.fillna(0, inplace=True)
-        
-        # Encode categorical data
-        for column in requirements_df.columns:
-            if column in label_encoders:
-                le = label_encoders[column]
-                requirements_df[column] = requirements_df[column].apply(lambda x: le.transform([x])[0] if pd.notna(x) and x in le.classes_ else -1)
-        
-        # Ensure all columns are of the correct type
-        for column in requirements_df.columns:
-            if column in label_encoders:
-                requirements_df[column] = requirements_df[column].astype(int)
-            else:
-                requirements_df[column] = requirements_df[column].astype(float)
-        
-        # Predict the best laptop
-        prediction = model.predict(requirements_df)[0]
-        
-        # Map prediction integer to ObjectId string
-        laptop_id = id_mapping.get(prediction, None)
+        # Predict the best laptop, batched with concurrent requests, as an ObjectId string
+        with span('predict'):
+            laptop_id = predict_batcher.predict(requirements)
         if not laptop_id:
             return jsonify({"error": "No laptop found for the recommendation"}), 404
         
@@ -88,7 +230,7 @@ def recommend_laptop():
             return jsonify({"error": f"Invalid laptop ID format: {laptop_id}"}), 400
         
         # Fetch the recommended laptop from the database
-        recommended_laptop = db.Laptops.find_one({"_id": predicted_laptop_id})
+        recommended_laptop = get_laptop(predicted_laptop_id)
         
         if not recommended_laptop:
             return jsonify({"error": "No laptop found for the recommendation"}), 404
@@ -100,6 +242,7 @@ def recommend_laptop():
         )
         if result.modified_count == 0:
             logging.warning(f"Laptop with ID {predicted_laptop_id} was not updated.")
+        set_laptop_status(recommended_laptop["_id"], "Assigned")
         
         # Create a new assignment entry
         new_assignment = {
@@ -111,23 +254,153 @@ def recommend_laptop():
         }
         db.Assignments.insert_one(new_assignment)
         
-        return jsonify({
-            "recommendedLaptop": {
-                "serialNumber": recommended_laptop['serialNumber'],
-                "model": recommended_laptop['model'],
-                "brand": recommended_laptop['brand'],
-                "specifications": recommended_laptop['specifications']
-            }
-        })
+        with span('serialize'):
+            response = jsonify({
+                "recommendedLaptop": {
+                    "serialNumber": recommended_laptop['serialNumber'],
+                    "model": recommended_laptop['model'],
+                    "brand": recommended_laptop['brand'],
+                    "specifications": recommended_laptop['specifications']
+                }
+            })
+        return response
     
     except Exception as e:
         logging.error(f"Error in /api/recommendations: {e}")
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
-@app.route('/api/reserve', methods=['POST'])
+@api.route('/api/recommendations/batch', methods=['POST'])
+@requires('laptopIndex')
+def recommend_laptops_batch():
+    try:
+        with span('parse'):
+            data = request.get_json()
+        records = data.get('requirements') if isinstance(data, dict) else data
+        
+        if not isinstance(records, list) or not records:
+            return jsonify({"error": "A non-empty list of requirements is required"}), 400
+        if len(records) > RECOMMENDATION_BATCH_MAX_SIZE:
+            return jsonify({"error": f"At most {RECOMMENDATION_BATCH_MAX_SIZE} requirements per request"}), 400
+        if not all(isinstance(record, dict) for record in records):
+            return jsonify({"error": "Each requirement must be an object with cpu, ram and storage"}), 400
+        
+        # Encode all requirements and predict in a single call
+        current = model_store.current()
+        with span('encode'):
+            rows = current.encoder.encode_many(records)
+        with span('predict'):
+            predictions = current.model.predict(rows)
+        
+        # Map predictions to ObjectIds
+        predicted_ids = []
+        for prediction in predictions:
+            laptop_id = current.id_mapping.get(prediction, None)
+            try:
+                predicted_ids.append(ObjectId(laptop_id) if laptop_id else None)
+            except Exception:
+                predicted_ids.append(None)
+        
+        # Claim every distinct recommended laptop that is still Available in one unordered bulk write,
+        # then read back the ones this request won
+        unique_ids = list(dict.fromkeys(laptop_id for laptop_id in predicted_ids if laptop_id is not None))
+        claim_id = ObjectId()
+        laptops = {}
+        if unique_ids:
+            db.Laptops.bulk_write([
+                UpdateOne({"_id": laptop_id, "status": "Available"}, {"$set": {"status": "Assigned", "allocationId": claim_id}})
+                for laptop_id in unique_ids
+            ], ordered=False)
+            for laptop in db.Laptops.find({"_id": {"$in": unique_ids}, "allocationId": claim_id}):
+                laptops[laptop["_id"]] = laptop
+                laptop_cache.put(laptop["_id"], laptop)
+                laptop_index.set_status(laptop["_id"], "Assigned")
+            lost = [laptop_id for laptop_id in unique_ids if laptop_id not in laptops]
+            if lost:
+                resync_laptops(lost)
+        
+        # Each claimed laptop goes to the first requirement that predicted it
+        recommendations = []
+        new_assignments = []
+        assigned_date = datetime.utcnow()
+        for laptop_id in predicted_ids:
+            laptop = laptops.pop(laptop_id, None)
+            if laptop is None:
+                unknown = laptop_id is None or laptop_index.status_of(laptop_id) is None
+                recommendations.append({"error": "No laptop found for the recommendation" if unknown else "Laptop is not available"})
+                continue
+            new_assignments.append({
+                "employeeId": None,  # No employee associated for this request
+                "laptopId": str(laptop["_id"]),
+                "assignedDate": assigned_date,
+                "returnedDate": None,
+                "status": "Active"
+            })
+            recommendations.append({"recommendedLaptop": laptop_summary(laptop)})
+        
+        # Create assignment entries in bulk, handing the claimed laptops back if that fails
+        if new_assignments:
+            try:
+                db.Assignments.insert_many(new_assignments)
+            except Exception:
+                db.Laptops.update_many({"allocationId": claim_id, "status": "Assigned"}, {"$set": {"status": "Available"}})
+                for assignment in new_assignments:
+                    set_laptop_status(ObjectId(assignment["laptopId"]), "Available")
+                raise
+        
+        with span('serialize'):
+            response = jsonify({"recommendations": recommendations})
+        return response
+    
+    except Exception as e:
+        logging.error(f"Error in /api/recommendations/batch: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@api.route('/api/recommendations/available', methods=['POST'])
+@requires('laptopIndex')
+def recommend_available_laptops():
+    try:
+        with span('parse'):
+            data = request.get_json()
+        
+        requirements = {
+            'cpu': data.get('cpu', ''),
+            'ram': data.get('ram', ''),
+            'storage': data.get('storage', '')
+        }
+        try:
+            k = int(data.get('k', ONBOARD_CANDIDATES))
+        except (TypeError, ValueError):
+            return jsonify({"error": "k must be an integer"}), 400
+        if k < 1:
+            return jsonify({"error": "k must be at least 1"}), 400
+        
+        # Find the k nearest Available laptops and fetch them with a single query
+        index = laptop_index
+        with span('encode'):
+            row = index.encoder.encode(requirements)
+        with span('rank'):
+            nearest = index.nearest(row, k=k)
+        laptops = {laptop["_id"]: laptop for laptop in db.Laptops.find({"_id": {"$in": [laptop_id for laptop_id, _ in nearest]}})}
+        
+        with span('serialize'):
+            response = jsonify({
+                "laptops": [
+                    {"laptopId": str(laptop_id), "distance": distance, **laptop_summary(laptops[laptop_id])}
+                    for laptop_id, distance in nearest if laptop_id in laptops
+                ]
+            })
+        return response
+    
+    except Exception as e:
+        logging.error(f"Error in /api/recommendations/available: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@api.route('/api/reserve', methods=['POST'])
+@requires('laptopIndex')
 def reserve_laptop():
     try:
-        data = request.get_json()
+        with span('parse'):
+            data = request.get_json()
         employee_name = data.get('name')
         laptop_id = data.get('laptopId')
         
@@ -135,7 +408,7 @@ def reserve_laptop():
             return jsonify({"error": "Employee name and laptop ID are required"}), 400
         
         # Fetch employee details
-        employee = db.Employees.find_one({"name": employee_name})
+        employee = get_employee_by_name(employee_name)
         if not employee:
             return jsonify({"error": "Employee not found"}), 404
         
@@ -145,13 +418,14 @@ def reserve_laptop():
         except Exception as e:
             return jsonify({"error": f"Invalid laptop ID format: {laptop_id}"}), 400
         
-        # Fetch laptop details
-        laptop = db.Laptops.find_one({"_id": laptop_id})
+        # Reserve the laptop only if it is still Available, in a single round trip
+        laptop = claim_laptop(laptop_id, "Reserved")
         if not laptop:
-            return jsonify({"error": "Laptop not found"}), 404
-        
-        # Check if the laptop is already reserved or assigned
-        if laptop["status"] != "Available":
+            # The index only needs a resync when it still believed the laptop was Available or did not know it
+            if laptop_index.status_of(laptop_id) in (None, "Available"):
+                resync_laptops([laptop_id])
+            if laptop_index.status_of(laptop_id) is None:
+                return jsonify({"error": "Laptop not found"}), 404
             return jsonify({"error": "Laptop is not available"}), 400
         
         # Create a new reservation entry
@@ -161,28 +435,26 @@ def reserve_laptop():
             "reservedDate": datetime.utcnow(),
             "status": "Reserved"
         }
-        result = db.Reservations.insert_one(new_reservation)
+        try:
+            result = db.Reservations.insert_one(new_reservation)
+        except Exception:
+            release_laptop(laptop["_id"], "Reserved")
+            raise
         if result.inserted_id is None:
             logging.warning("Reservation entry was not created.")
         
-        # Update laptop status to reserved
-        result = db.Laptops.update_one(
-            {"_id": laptop["_id"]},
-            {"$set": {"status": "Reserved"}}
-        )
-        if result.modified_count == 0:
-            logging.warning(f"Laptop with ID {laptop_id} was not updated.")
-        
         return jsonify({"message": "Laptop reserved successfully"})
     
     except Exception as e:
         logging.error(f"Error in /api/reserve: {e}")
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
-@app.route('/api/onboard', methods=['POST'])
+@api.route('/api/onboard', methods=['POST'])
+@requires('laptopIndex')
 def onboard_new_hire():
     try:
-        data = request.get_json()
+        with span('parse'):
+            data = request.get_json()
         new_employee = {
             '_id': data.get('_id'),
             'cpu': data.get('cpu'),
@@ -200,28 +472,11 @@ def onboard_new_hire():
             'storage': new_employee['storage']
         }
         
-        # Convert to DataFrame
-        employee_df = pd.DataFrame([employee_details])
-        
-        # Encode the details
-        for column, le in label_encoders.items():
-            if column in employee_df.columns:
-                employee_df[column] = employee_df[column].apply(lambda x: le.transform([x])[0] if pd.notna(x) and x in le.classes_ else -1)
-        
-        # Ensure all columns are of the correct type
-        for column in employee_df.columns:
-            if column in label_encoders:
-                employee_df[column] = employee_df[column].astype(int)
-            else:
-                employee_df[column] = employee_df[column].astype(float)
-        
-        # Predict the laptop
-        predicted_laptop_idx = model.predict(employee_df)[0]
-        predicted_laptop_id = id_mapping[predicted_laptop_idx]
-        
-        # Debugging information
-        logging.debug(f"Predicted laptop index: {predicted_laptop_idx}")
-        logging.debug(f"Predicted laptop ID: {predicted_laptop_id}")
+        # Predict the laptop, batched with concurrent requests
+        with span('predict'):
+            predicted_laptop_id = predict_batcher.predict(employee_details)
+        if not predicted_laptop_id:
+            return jsonify({"error": "No laptop found for the recommendation"}), 404
         
         # Ensure laptop_id is a valid ObjectId
         try:
@@ -229,37 +484,54 @@ def onboard_new_hire():
         except Exception as e:
             return jsonify({"error": f"Invalid laptop ID format: {predicted_laptop_id}"}), 400
         
-        # Check the availability of the recommended laptop
-        laptop = db.Laptops.find_one({"_id": predicted_laptop_id, "status": "Available"})
-        
-        # Debugging information
-        logging.debug(f"Laptop found: {laptop}")
+        # Rank candidates: the predicted laptop, then the nearest Available laptops. The predicted laptop is
+        # always tried whatever this process's index says; MongoDB decides in the claim below.
+        index = laptop_index
+        with span('encode'):
+            row = index.encoder.encode(employee_details)
+        with span('rank'):
+            candidate_ids = [laptop_id for laptop_id, _ in index.nearest(row, k=ONBOARD_CANDIDATES)]
+        candidate_ids = [predicted_laptop_id] + [laptop_id for laptop_id in candidate_ids if laptop_id != predicted_laptop_id]
+        
+        # Claim the first candidate that is still Available; concurrent requests can never claim the same laptop
+        laptop = None
+        contended = []
+        for candidate_id in candidate_ids:
+            laptop = claim_laptop(candidate_id, "Assigned")
+            if laptop:
+                break
+            contended.append(candidate_id)
+        
+        # Resync index entries that turned out to be stale, demoting laptops that were not Available
+        if contended:
+            resync_laptops(contended)
         
         if laptop:
             # Assign the laptop to the new hire
-            result = db.Assignments.insert_one({
-                "employeeId": new_employee['_id'],
-                "laptopId": str(predicted_laptop_id),
-                "status": "Active",
-                "assignedDate": datetime.utcnow()
-            })
+            try:
+                result = db.Assignments.insert_one({
+                    "employeeId": new_employee['_id'],
+                    "laptopId": str(laptop["_id"]),
+                    "status": "Active",
+                    "assignedDate": datetime.utcnow()
+                })
+            except Exception:
+                release_laptop(laptop["_id"], "Assigned")
+                raise
             if result.inserted_id is None:
                 logging.warning("Assignment entry was not created.")
             
-            # Update the laptop status
-            result = db.Laptops.update_one({"_id": predicted_laptop_id}, {"$set": {"status": "Assigned"}})
-            if result.modified_count == 0:
-                logging.warning(f"Laptop with ID {predicted_laptop_id} was not updated.")
-            
-            return jsonify({
-                "message": f"Laptop {predicted_laptop_id} assigned to employee {new_employee['_id']}.",
-                "laptop": {
-                    "serialNumber": laptop['serialNumber'],
-                    "model": laptop['model'],
-                    "brand": laptop['brand'],
-                    "specifications": laptop['specifications']
-                }
-            })
+            with span('serialize'):
+                response = jsonify({
+                    "message": f"Laptop {laptop['_id']} assigned to employee {new_employee['_id']}.",
+                    "laptop": {
+                        "serialNumber": laptop['serialNumber'],
+                        "model": laptop['model'],
+                        "brand": laptop['brand'],
+                        "specifications": laptop['specifications']
+                    }
+                })
+            return response
         else:
             return jsonify({"error": "No available laptops match the criteria for the new hire."}), 404
     
@@ -267,81 +539,397 @@ def onboard_new_hire():
         logging.error(f"Error in /api/onboard: {e}")
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
-@app.route('/api/offboard', methods=['POST'])
+def allocate_cohort(hires, dry_run=False):
+    # Assign a cohort jointly: one spec-distance cost matrix over every hire and every Available
+    # laptop, solved as a minimum-cost matching, then committed with one bulk write per collection.
+    # Planned laptops are claimed only if still Available; hires whose laptop was taken meanwhile
+    # are re-solved against the refreshed index.
+    from allocation import spec_cost_matrix, allocate
+    index = laptop_index
+    with span('encode'):
+        hire_rows = index.encoder.encode_many(hires)
+    allocation_id = ObjectId()
+    assigned = []
+    laptops = {}
+    pending = list(range(len(hires)))
+    
+    for _ in range(COHORT_MAX_ROUNDS):
+        laptop_ids, laptop_rows = index.snapshot("Available")
+        if not pending or not laptop_ids:
+            break
+        with span('allocate'):
+            cost = spec_cost_matrix(hire_rows[pending], laptop_rows)
+            rows, cols = allocate(cost)
+        plan = [(pending[row], laptop_ids[col], float(cost[row, col])) for row, col in zip(rows, cols)]
+        if dry_run:
+            assigned = plan
+            break
+        
+        # Claim every planned laptop in one unordered bulk write, then read back the ones this allocation won
+        db.Laptops.bulk_write([
+            UpdateOne({"_id": laptop_id, "status": "Available"}, {"$set": {"status": "Assigned", "allocationId": allocation_id}})
+            for _, laptop_id, _ in plan
+        ], ordered=False)
+        claimed = set()
+        for laptop in db.Laptops.find({"_id": {"$in": [laptop_id for _, laptop_id, _ in plan]}, "allocationId": allocation_id}):
+            claimed.add(laptop["_id"])
+            laptops[laptop["_id"]] = laptop
+            laptop_cache.put(laptop["_id"], laptop)
+            index.set_status(laptop["_id"], "Assigned")
+        
+        lost = [laptop_id for _, laptop_id, _ in plan if laptop_id not in claimed]
+        assigned += [entry for entry in plan if entry[1] in claimed]
+        done = {hire_idx for hire_idx, _, _ in assigned}
+        pending = [hire_idx for hire_idx in pending if hire_idx not in done]
+        if not lost:
+            break
+        resync_laptops(lost)
+    
+    if assigned and not dry_run:
+        assigned_date = datetime.utcnow()
+        try:
+            db.Assignments.insert_many([{
+                "employeeId": hires[hire_idx]['_id'],
+                "laptopId": str(laptop_id),
+                "status": "Active",
+                "assignedDate": assigned_date,
+                "allocationId": str(allocation_id)
+            } for hire_idx, laptop_id, _ in assigned])
+        except Exception:
+            # Hand the whole allocation's laptops back
+            db.Laptops.update_many({"allocationId": allocation_id, "status": "Assigned"}, {"$set": {"status": "Available"}})
+            for _, laptop_id, _ in assigned:
+                set_laptop_status(laptop_id, "Available")
+            raise
+    
+    if dry_run:
+        laptops = {laptop["_id"]: laptop for laptop in db.Laptops.find({"_id": {"$in": [laptop_id for _, laptop_id, _ in assigned]}})}
+    done = {hire_idx for hire_idx, _, _ in assigned}
+    return {
+        "allocationId": None if dry_run else str(allocation_id),
+        "dryRun": dry_run,
+        "totalCost": sum(cost for _, _, cost in assigned),
+        "assignments": [{
+            "employeeId": hires[hire_idx]['_id'],
+            "laptopId": str(laptop_id),
+            "cost": cost,
+            "laptop": laptop_summary(laptops[laptop_id])
+        } for hire_idx, laptop_id, cost in sorted(assigned) if laptop_id in laptops],
+        "unassigned": [hire['_id'] for hire_idx, hire in enumerate(hires) if hire_idx not in done]
+    }
+
+@api.route('/api/onboard/cohort', methods=['POST'])
+@requires('laptopIndex')
+def onboard_cohort():
+    try:
+        with span('parse'):
+            data = request.get_json()
+        hires = data.get('hires') if isinstance(data, dict) else data
+        dry_run = bool(data.get('dryRun', False)) if isinstance(data, dict) else False
+        
+        if not isinstance(hires, list) or not hires:
+            return jsonify({"error": "A non-empty list of hires is required"}), 400
+        if len(hires) > COHORT_MAX_SIZE:
+            return jsonify({"error": f"At most {COHORT_MAX_SIZE} hires can be allocated per request"}), 400
+        if not all(isinstance(hire, dict) and hire.get('_id') and hire.get('cpu') and hire.get('ram') and hire.get('storage') for hire in hires):
+            return jsonify({"error": "Each hire requires _id, cpu, ram, and storage"}), 400
+        if len({str(hire['_id']) for hire in hires}) != len(hires):
+            return jsonify({"error": "Hire IDs must be unique"}), 400
+        
+        result = allocate_cohort(hires, dry_run=dry_run)
+        with span('serialize'):
+            response = jsonify(result)
+        return response
+    
+    except Exception as e:
+        logging.error(f"Error in /api/onboard/cohort: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+def offboard_employees(employee_ids):
+    # Return the laptops of many employees at once: one $lookup aggregation finds the active
+    # assignments and their laptops, then two ordered bulk writes apply every status change.
+    pipeline = [
+        {"$match": {"employeeId": {"$in": employee_ids}, "status": "Active"}},
+        {"$addFields": {"laptopObjectId": {"$convert": {"input": "$laptopId", "to": "objectId", "onError": None, "onNull": None}}}},
+        {"$lookup": {"from": "Laptops", "localField": "laptopObjectId", "foreignField": "_id", "as": "laptop"}},
+        {"$project": {"employeeId": 1, "laptopId": 1, "laptopObjectId": 1, "laptopFound": {"$gt": [{"$size": "$laptop"}, 0]}}}
+    ]
+    
+    results = {employee_id: {"employeeId": employee_id, "returnedLaptops": [], "missingLaptops": []} for employee_id in employee_ids}
+    assignment_updates = []
+    laptop_updates = []
+    returned_laptop_ids = []
+    returned_date = datetime.utcnow()
+    for assignment in db.Assignments.aggregate(pipeline):
+        result = results[assignment["employeeId"]]
+        if not assignment["laptopFound"]:
+            logging.warning(f"Laptop with ID {assignment['laptopId']} not found.")
+            result["missingLaptops"].append(assignment["laptopId"])
+            continue
+        
+        assignment_updates.append(UpdateOne(
+            {"_id": assignment["_id"], "status": "Active"},
+            {"$set": {"returnedDate": returned_date, "status": "Returned"}}
+        ))
+        laptop_updates.append(UpdateOne(
+            {"_id": assignment["laptopObjectId"]},
+            {"$set": {"status": "Available"}}
+        ))
+        returned_laptop_ids.append(assignment["laptopObjectId"])
+        result["returnedLaptops"].append(assignment["laptopId"])
+    
+    if assignment_updates:
+        result = db.Assignments.bulk_write(assignment_updates, ordered=True)
+        if result.matched_count != len(assignment_updates):
+            logging.warning(f"{len(assignment_updates) - result.matched_count} assignments were not found for update.")
+        
+        result = db.Laptops.bulk_write(laptop_updates, ordered=True)
+        if result.matched_count != len(laptop_updates):
+            logging.warning(f"{len(laptop_updates) - result.matched_count} laptops were not found for update.")
+        for laptop_id in returned_laptop_ids:
+            set_laptop_status(laptop_id, "Available")
+    
+    return [results[employee_id] for employee_id in employee_ids]
+
+@api.route('/api/offboard', methods=['POST'])
+@requires('laptopIndex')
 def offboard_employee():
     try:
-        data = request.get_json()
+        with span('parse'):
+            data = request.get_json()
         employee_id = data.get('employeeId')
         
         if not employee_id:
             return jsonify({"error": "Employee ID is required"}), 400
         
-        # Find all active assignments for the employee
-        active_assignments = list(db.Assignments.find({"employeeId": employee_id, "status": "Active"}))
-        if not active_assignments:
+        result = offboard_employees([employee_id])[0]
+        if not result["returnedLaptops"] and not result["missingLaptops"]:
             return jsonify({"message": "No active assignments found for this employee"}), 404
         
-        for assignment in active_assignments:
-            try:
-                laptop_id = ObjectId(assignment['laptopId'])
-                laptop = db.Laptops.find_one({"_id": laptop_id})
-                
-                if not laptop:
-                    logging.warning(f"Laptop with ID {laptop_id} not found.")
-                    continue
-                
-                result = db.Assignments.update_one(
-                    {"_id": assignment["_id"]},
-                    {"$set": {"returnedDate": datetime.utcnow(), "status": "Returned"}}
-                )
-                if result.matched_count == 0:
-                    logging.warning(f"Assignment with ID {assignment['_id']} not found for update.")
-                
-                result = db.Laptops.update_one(
-                    {"_id": laptop["_id"]},
-                    {"$set": {"status": "Available"}}
-                )
-                if result.matched_count == 0:
-                    logging.warning(f"Laptop with ID {laptop['_id']} not found for update.")
-            
-            except Exception as e:
-                logging.error(f"Error updating assignment or laptop: {e}")
-        
         return jsonify({"message": "Employee offboarding processed successfully"})
     
     except Exception as e:
         logging.error(f"Error in /api/offboard: {e}")
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
-@app.route('/api/forecast_demand', methods=['GET'])
+@api.route('/api/offboard/batch', methods=['POST'])
+@requires('laptopIndex')
+def offboard_employees_batch():
+    try:
+        with span('parse'):
+            data = request.get_json()
+        employee_ids = data.get('employeeIds') if isinstance(data, dict) else data
+        
+        if not isinstance(employee_ids, list) or not employee_ids:
+            return jsonify({"error": "A non-empty list of employee IDs is required"}), 400
+        if not all(isinstance(employee_id, str) and employee_id for employee_id in employee_ids):
+            return jsonify({"error": "Employee IDs must be non-empty strings"}), 400
+        
+        # Preserve request order while dropping duplicates
+        employee_ids = list(dict.fromkeys(employee_ids))
+        results = offboard_employees(employee_ids)
+        for result in results:
+            result["status"] = "offboarded" if result["returnedLaptops"] or result["missingLaptops"] else "noActiveAssignments"
+        
+        return jsonify({"results": results})
+    
+    except Exception as e:
+        logging.error(f"Error in /api/offboard/batch: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@api.route('/api/forecast_demand', methods=['GET'])
+@requires('database', 'forecasting')
 def forecast_laptop_demand():
+    from demand_forecast import forecast_params
     try:
-        demand_model = load_demand_model()
-        if not demand_model:
-            return jsonify({"error": "Demand forecasting model not available."}), 500
-        
-        # Generate future periods
-        historical_data = list(db.Assignments.find({"status": "Active"}))
-        historical_df = pd.DataFrame(historical_data)
-        historical_df['assignedDate'] = pd.to_datetime(historical_df['assignedDate'])
-        historical_df['month'] = historical_df['assignedDate'].dt.to_period('M')
-        demand_df = historical_df.groupby(['month', 'laptopId']).size().reset_index(name='demand')
-        demand_pivot = demand_df.pivot(index='month', columns='laptopId', values='demand').fillna(0)
-        future_periods = np.arange(len(demand_pivot) + 12).reshape(-1, 1)  # Forecast for 12 periods ahead
-        
-        # Predict future demand
-        predicted_demand = demand_model.predict(future_periods)
-        
-        # Prepare results
-        demand_forecast = {}
-        for idx, laptop_id in enumerate(demand_pivot.columns):
-            demand_forecast[str(laptop_id)] = predicted_demand[:, idx].tolist()
-        
-        return jsonify({"demandForecast": demand_forecast})
+        try:
+            params = forecast_params(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if params is not None:
+            # Only the requested horizon, per laptop/model/brand/spec series
+            group, horizon = params
+            with span('forecast'):
+                result = grouped_forecast_cache.get(db, group, horizon)
+            with span('serialize'):
+                response = jsonify(result.forecast)
+        else:
+            # Served from memory until new assignments arrive or the model file changes
+            result = forecast_cache.get(db)
+            if result is None:
+                return jsonify({"error": "Demand forecasting model not available."}), 500
+            
+            with span('serialize'):
+                response = jsonify({"demandForecast": result.forecast})
+        response.set_etag(result.etag)
+        response.last_modified = result.last_modified
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     
     except Exception as e:
         logging.error(f"Error in /api/forecast_demand: {e}")
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
+def list_response(documents, next_after):
+    # Pages are plain JSON arrays; the cursor for the next page travels in headers
+    response = current_app.response_class(dumps(documents), mimetype='application/json')
+    if next_after is not None:
+        args = request.args.to_dict()
+        args['after'] = str(next_after)
+        response.headers['X-Next-Cursor'] = str(next_after)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response
+
+def list_resource(name):
+    try:
+        try:
+            params = list_params(request.args, RESOURCES[name])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        with span('query'):
+            documents, next_after = fetch_page(db[RESOURCES[name].collection], params)
+        with span('serialize'):
+            return list_response(documents, next_after)
+    
+    except Exception as e:
+        logging.error(f"Error listing {name}: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def export_resource(name):
+    try:
+        resource = RESOURCES[name]
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_MIMETYPES:
+            return jsonify({"error": "format must be ndjson or csv"}), 400
+        try:
+            params = list_params(request.args, resource)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Requested fields become the CSV columns, in request order
+        columns = list(params.projection) if params.projection else resource.columns
+        response = current_app.response_class(export_rows(db[resource.collection], params, export_format, columns), mimetype=EXPORT_MIMETYPES[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+        return response
+    
+    except Exception as e:
+        logging.error(f"Error exporting {name}: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+# Exports live under their own prefix so they never collide with per-document routes like /api/employees/<name>
+@api.route('/api/exports/laptops', methods=['GET'])
+@requires('database')
+def export_laptops():
+    return export_resource('laptops')
+
+@api.route('/api/exports/assignments', methods=['GET'])
+@requires('database')
+def export_assignments():
+    return export_resource('assignments')
+
+@api.route('/api/exports/employees', methods=['GET'])
+@requires('database')
+def export_employees():
+    return export_resource('employees')
+
+@api.route('/api/laptops', methods=['GET'])
+@requires('database')
+def list_laptops():
+    return list_resource('laptops')
+
+@api.route('/api/laptops/utilization', methods=['GET'])
+@requires('database')
+def laptop_utilization():
+    try:
+        try:
+            params = list_params(request.args, RESOURCES['laptops'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        params.projection = {"serialNumber": 1, "status": 1, "location": 1}
+        
+        with span('query'):
+            laptops, next_after = fetch_page(db.Laptops, params)
+            rows = utilization(db, laptops)
+        with span('serialize'):
+            return list_response(rows, next_after)
+    
+    except Exception as e:
+        logging.error(f"Error in /api/laptops/utilization: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@api.route('/api/assignments', methods=['GET'])
+@requires('database')
+def list_assignments():
+    return list_resource('assignments')
+
+@api.route('/api/employees', methods=['GET'])
+@requires('database')
+def list_employees():
+    return list_resource('employees')
+
+@api.route('/api/employees/<name>', methods=['GET'])
+@requires('database')
+def get_employee(name):
+    try:
+        employee = get_employee_by_name(name)
+        if not employee:
+            return jsonify({"error": "Employee not found"}), 404
+        return current_app.response_class(dumps(employee), mimetype='application/json')
+    
+    except Exception as e:
+        logging.error(f"Error in /api/employees/{name}: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@api.route('/api/predict/stats', methods=['GET'])
+@requires('model')
+def predict_stats():
+    return jsonify(predict_batcher.stats())
+
+@api.route('/api/jobs/stats', methods=['GET'])
+def job_stats():
+    return jsonify(job_worker.stats() if job_worker is not None else {})
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return current_app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "laptops": laptop_cache.stats(),
+        "employees": employee_cache.stats(),
+        "forecast": {"hits": forecast_cache.hits, "misses": forecast_cache.misses} if forecast_cache is not None else None,
+        "groupedForecast": {"hits": grouped_forecast_cache.hits, "misses": grouped_forecast_cache.misses} if grouped_forecast_cache is not None else None,
+        "followers": {follower.collection.name: follower.mode for follower in cache_followers}
+    })
+
+@api.route('/api/ready', methods=['GET'])
+def readiness():
+    # 200 once the model, database and laptop index are warm, else 503 with what is still missing
+    ready = warmup.is_ready(*READY_COMPONENTS)
+    return jsonify({"ready": ready, "components": warmup.status()}), 200 if ready else 503
+
+def create_app(warm=config.WARM_ON_START):
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    
+    # Per-endpoint latency, stage spans and MongoDB command timings, exported on /metrics
+    instrument_flask(app)
+    
+    # Set up logging
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    # Load the model, connect and build the index in the background, retrying until MongoDB answers;
+    # the process serves (and reports not ready) meanwhile
+    if warm:
+        warmup.start(config.STARTUP_RETRY_BACKOFF, config.STARTUP_RETRY_MAX_BACKOFF)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
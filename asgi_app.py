@@ -0,0 +1,525 @@
+import asyncio
+import logging
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from quart import Quart, request, jsonify
+
+import config
+from batcher import PredictBatcher
+from cache import DocumentCache
+from demand_forecast import DemandModelCache, ForecastCache, GroupedForecastCache, assignments_watermark_async, forecast_params
+from instrumentation import instrument_quart
+from jobs import JobWorker, add_default_jobs
+from laptop_index import LaptopIndex
+from metrics import REGISTRY
+from model_artifact import ModelStore, load_pickle
+
+# Async serving mode: the app.py endpoints on an event loop, backed by Motor. Serve with
+#   hypercorn asgi_app:app --workers 4
+# Mongo round trips no longer hold a worker thread, independent queries run concurrently,
+# and predict/index searches run on worker threads so they never block the loop.
+
+app = Quart(__name__)
+
+# Request latency and MongoDB command timings, exported on /metrics. Motor runs commands on its
+# own threads, so they are timed but not attributed to an endpoint.
+instrument_quart(app)
+
+# Models are fitted on DataFrames but served with plain arrays
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+model_store = ModelStore(config.MODEL_ARTIFACT_DIR)
+try:
+    if not model_store.reload():
+        model_store.set(load_pickle(config.MODEL_PICKLE_PATH))
+except Exception as e:
+    logging.error(f"Error loading model and encoders: {e}")
+    raise
+
+demand_model_cache = DemandModelCache('laptop_demand_model.pkl')
+forecast_cache = ForecastCache(demand_model_cache)
+grouped_forecast_cache = GroupedForecastCache()
+
+laptop_cache = DocumentCache(maxsize=config.CACHE_SIZE, ttl=config.CACHE_TTL)
+employee_cache = DocumentCache(maxsize=config.CACHE_SIZE, ttl=config.CACHE_TTL)
+
+# Concurrent requests share one predict call per batch; awaiting the Future never blocks the loop
+predict_batcher = PredictBatcher(model_store, max_batch=config.PREDICT_BATCH_MAX_ROWS, window=config.PREDICT_BATCH_WINDOW_MS / 1000.0)
+REGISTRY.add_histogram('lamp_predict_batch_size', "Rows per batched predict call", predict_batcher.batch_sizes)
+REGISTRY.add_histogram('lamp_predict_queue_wait_seconds', "Time a row waits for its batch to run", predict_batcher.queue_wait)
+
+# Other CPU-bound work (index search, forecast fitting) runs here, off the event loop
+cpu_executor = ThreadPoolExecutor(max_workers=config.PREDICT_WORKERS, thread_name_prefix='lamp-cpu')
+
+# Reservation expiry, retraining and forecast precomputation, started with the server
+job_worker = JobWorker(config.ForkSafeDatabase(config.MONGO_DB_NAME), max_workers=config.JOB_WORKERS)
+
+# Number of nearest Available laptops to consider when onboarding
+ONBOARD_CANDIDATES = 5
+
+# Motor client and laptop index, created on the serving event loop in startup(), and the sync
+# database handle the forecast caches query from the CPU pool
+db = None
+laptop_index = None
+sync_db = None
+
+
+def laptop_summary(laptop):
+    return {
+        "serialNumber": laptop['serialNumber'],
+        "model": laptop['model'],
+        "brand": laptop['brand'],
+        "specifications": laptop['specifications']
+    }
+
+
+async def run_cpu(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, func, *args)
+
+
+async def load_laptop_index(encoder):
+    index = LaptopIndex(encoder)
+    projection = {"specifications": 1, "status": 1, **{column: 1 for column in encoder.input_columns}}
+    async for laptop in db.Laptops.find({}, projection):
+        index.upsert(laptop)
+    return index
+
+
+@app.before_serving
+async def startup():
+    global db, laptop_index, sync_db
+    client = AsyncIOMotorClient(
+        config.MONGO_URI,
+        maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=config.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=config.MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=config.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    )
+    db = client[config.MONGO_DB_NAME]
+    if config.MONGO_ENSURE_INDEXES:
+        try:
+            await asyncio.gather(*[
+                db[collection].create_index(keys)
+                for collection, indexes in config.INDEXES.items() for keys in indexes
+            ])
+        except Exception as e:
+            logging.error(f"Error creating MongoDB indexes: {e}")
+    laptop_index = await load_laptop_index(model_store.current().encoder)
+
+    # get_db may create indexes with the sync driver, so it runs off the loop, once
+    sync_db = await run_cpu(config.get_db)
+
+    # The watcher swaps models on its own thread; rebuild the index on the loop
+    loop = asyncio.get_running_loop()
+
+    def rebuild_laptop_index(artifact):
+        async def rebuild():
+            global laptop_index
+            laptop_index = await load_laptop_index(artifact.encoder)
+        asyncio.run_coroutine_threadsafe(rebuild(), loop)
+
+    model_store.on_swap = rebuild_laptop_index
+    if config.MODEL_WATCH_INTERVAL > 0:
+        model_store.watch(config.MODEL_WATCH_INTERVAL)
+
+    # Background jobs use the sync client on their own threads; released laptops are resynced on the loop
+    if config.BACKGROUND_JOBS:
+        def on_released(laptop_ids):
+            asyncio.run_coroutine_threadsafe(resync_laptops(laptop_ids), loop).result()
+
+        add_default_jobs(
+            job_worker, config, model_store, forecast_cache, grouped_forecast_cache, on_released,
+            sync_index=lambda laptops: laptop_index.sync(laptops)
+        ).start()
+
+
+@app.after_serving
+async def shutdown():
+    job_worker.stop()
+    model_store.stop()
+    predict_batcher.stop()
+    cpu_executor.shutdown(wait=False)
+    if db is not None:
+        db.client.close()
+
+
+async def get_laptop(laptop_id):
+    laptop = laptop_cache.get(laptop_id)
+    if laptop is None:
+        laptop = await db.Laptops.find_one({"_id": laptop_id})
+        if laptop is not None:
+            laptop_cache.put(laptop_id, laptop)
+    return laptop
+
+
+async def get_employee_by_name(name):
+    employee = employee_cache.get(name)
+    if employee is None:
+        employee = await db.Employees.find_one({"name": name})
+        if employee is not None:
+            employee_cache.put(name, employee)
+    return employee
+
+
+def set_laptop_status(laptop_id, status):
+    laptop_cache.update(laptop_id, {"status": status})
+    laptop_index.set_status(laptop_id, status)
+
+
+async def claim_laptop(laptop_id, status):
+    # Atomically move a laptop from Available to status; None if it was not Available
+    laptop = await db.Laptops.find_one_and_update(
+        {"_id": laptop_id, "status": "Available"},
+        {"$set": {"status": status}},
+        return_document=ReturnDocument.AFTER
+    )
+    if laptop is not None:
+        laptop_cache.put(laptop_id, laptop)
+        laptop_index.set_status(laptop_id, status)
+    return laptop
+
+
+async def release_laptop(laptop_id, status):
+    await db.Laptops.update_one({"_id": laptop_id, "status": status}, {"$set": {"status": "Available"}})
+    set_laptop_status(laptop_id, "Available")
+
+
+async def resync_laptops(laptop_ids):
+    found = set()
+    async for laptop in db.Laptops.find({"_id": {"$in": laptop_ids}}):
+        found.add(laptop["_id"])
+        laptop_cache.put(laptop["_id"], laptop)
+        laptop_index.upsert(laptop)
+    for laptop_id in laptop_ids:
+        if laptop_id not in found:
+            laptop_cache.invalidate(laptop_id)
+            laptop_index.remove(laptop_id)
+
+
+async def predict_laptop(requirements):
+    if predict_batcher.max_batch <= 1:
+        return (await run_cpu(predict_batcher.predict_many, [requirements]))[0]
+    return await asyncio.wrap_future(predict_batcher.submit(requirements))
+
+
+def rank_candidates(requirements, predicted_laptop_id):
+    # Predicted laptop first, whatever this process's index says (the claim decides), then the
+    # nearest Available laptops
+    index = laptop_index
+    candidate_ids = [laptop_id for laptop_id, _ in index.nearest(index.encoder.encode(requirements), k=ONBOARD_CANDIDATES)]
+    try:
+        predicted_laptop_id = ObjectId(predicted_laptop_id)
+    except Exception:
+        return candidate_ids
+    return [predicted_laptop_id] + [laptop_id for laptop_id in candidate_ids if laptop_id != predicted_laptop_id]
+
+
+@app.route('/api/recommendations', methods=['POST'])
+async def recommend_laptop():
+    try:
+        data = await request.get_json()
+
+        requirements = {
+            'cpu': data.get('cpu', ''),
+            'ram': data.get('ram', ''),
+            'storage': data.get('storage', '')
+        }
+
+        laptop_id = await predict_laptop(requirements)
+        if not laptop_id:
+            return jsonify({"error": "No laptop found for the recommendation"}), 404
+
+        try:
+            predicted_laptop_id = ObjectId(laptop_id)
+        except Exception:
+            return jsonify({"error": f"Invalid laptop ID format: {laptop_id}"}), 400
+
+        recommended_laptop = await get_laptop(predicted_laptop_id)
+        if not recommended_laptop:
+            return jsonify({"error": "No laptop found for the recommendation"}), 404
+
+        # The status update and the assignment insert are independent writes
+        result, _ = await asyncio.gather(
+            db.Laptops.update_one({"_id": recommended_laptop["_id"]}, {"$set": {"status": "Assigned"}}),
+            db.Assignments.insert_one({
+                "employeeId": None,  # No employee associated for this request
+                "laptopId": str(recommended_laptop["_id"]),
+                "assignedDate": datetime.utcnow(),
+                "returnedDate": None,
+                "status": "Active"
+            })
+        )
+        if result.modified_count == 0:
+            logging.warning(f"Laptop with ID {predicted_laptop_id} was not updated.")
+        set_laptop_status(recommended_laptop["_id"], "Assigned")
+
+        return jsonify({"recommendedLaptop": laptop_summary(recommended_laptop)})
+
+    except Exception as e:
+        logging.error(f"Error in /api/recommendations: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+
+@app.route('/api/reserve', methods=['POST'])
+async def reserve_laptop():
+    try:
+        data = await request.get_json()
+        employee_name = data.get('name')
+        laptop_id = data.get('laptopId')
+
+        if not employee_name or not laptop_id:
+            return jsonify({"error": "Employee name and laptop ID are required"}), 400
+
+        try:
+            laptop_object_id = ObjectId(laptop_id)
+        except Exception:
+            laptop_object_id = None
+
+        # Look up the employee and the laptop concurrently (both reads, usually cache hits), and
+        # only claim the laptop once the request is known to be valid
+        employee, laptop = await asyncio.gather(
+            get_employee_by_name(employee_name),
+            get_laptop(laptop_object_id) if laptop_object_id else asyncio.sleep(0)
+        )
+        if not employee:
+            return jsonify({"error": "Employee not found"}), 404
+        if laptop_object_id is None:
+            return jsonify({"error": f"Invalid laptop ID format: {laptop_id}"}), 400
+        if not laptop:
+            return jsonify({"error": "Laptop not found"}), 404
+
+        # Reserve the laptop only if it is still Available, in a single round trip
+        laptop = await claim_laptop(laptop_object_id, "Reserved")
+        if not laptop:
+            if laptop_index.status_of(laptop_object_id) in (None, "Available"):
+                await resync_laptops([laptop_object_id])
+            if laptop_index.status_of(laptop_object_id) is None:
+                return jsonify({"error": "Laptop not found"}), 404
+            return jsonify({"error": "Laptop is not available"}), 400
+
+        try:
+            result = await db.Reservations.insert_one({
+                "employeeId": str(employee["_id"]),
+                "laptopId": str(laptop["_id"]),
+                "reservedDate": datetime.utcnow(),
+                "status": "Reserved"
+            })
+        except Exception:
+            await release_laptop(laptop["_id"], "Reserved")
+            raise
+        if result.inserted_id is None:
+            logging.warning("Reservation entry was not created.")
+
+        return jsonify({"message": "Laptop reserved successfully"})
+
+    except Exception as e:
+        logging.error(f"Error in /api/reserve: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+
+@app.route('/api/onboard', methods=['POST'])
+async def onboard_new_hire():
+    try:
+        data = await request.get_json()
+        new_employee = {
+            '_id': data.get('_id'),
+            'cpu': data.get('cpu'),
+            'ram': data.get('ram'),
+            'storage': data.get('storage')
+        }
+
+        if not new_employee['_id'] or not new_employee['cpu'] or not new_employee['ram'] or not new_employee['storage']:
+            return jsonify({"error": "Employee ID, cpu, ram, and storage are required"}), 400
+
+        employee_details = {
+            'cpu': new_employee['cpu'],
+            'ram': new_employee['ram'],
+            'storage': new_employee['storage']
+        }
+        predicted_laptop_id = await predict_laptop(employee_details)
+        candidate_ids = await run_cpu(rank_candidates, employee_details, predicted_laptop_id)
+
+        # Claims stay sequential: each one only runs if the previous candidate was taken
+        laptop = None
+        contended = []
+        for candidate_id in candidate_ids:
+            laptop = await claim_laptop(candidate_id, "Assigned")
+            if laptop:
+                break
+            contended.append(candidate_id)
+
+        if not laptop:
+            if contended:
+                await resync_laptops(contended)
+            return jsonify({"error": "No available laptops match the criteria for the new hire."}), 404
+
+        # Resync stale index entries while the assignment is written
+        assignment = db.Assignments.insert_one({
+            "employeeId": new_employee['_id'],
+            "laptopId": str(laptop["_id"]),
+            "status": "Active",
+            "assignedDate": datetime.utcnow()
+        })
+        try:
+            if contended:
+                result, _ = await asyncio.gather(assignment, resync_laptops(contended))
+            else:
+                result = await assignment
+        except Exception:
+            await release_laptop(laptop["_id"], "Assigned")
+            raise
+        if result.inserted_id is None:
+            logging.warning("Assignment entry was not created.")
+
+        return jsonify({
+            "message": f"Laptop {laptop['_id']} assigned to employee {new_employee['_id']}.",
+            "laptop": laptop_summary(laptop)
+        })
+
+    except Exception as e:
+        logging.error(f"Error in /api/onboard: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+
+async def offboard_employees(employee_ids):
+    # Same $lookup aggregation and ordered bulk writes as app.offboard_employees
+    pipeline = [
+        {"$match": {"employeeId": {"$in": employee_ids}, "status": "Active"}},
+        {"$addFields": {"laptopObjectId": {"$convert": {"input": "$laptopId", "to": "objectId", "onError": None, "onNull": None}}}},
+        {"$lookup": {"from": "Laptops", "localField": "laptopObjectId", "foreignField": "_id", "as": "laptop"}},
+        {"$project": {"employeeId": 1, "laptopId": 1, "laptopObjectId": 1, "laptopFound": {"$gt": [{"$size": "$laptop"}, 0]}}}
+    ]
+
+    results = {employee_id: {"employeeId": employee_id, "returnedLaptops": [], "missingLaptops": []} for employee_id in employee_ids}
+    assignment_updates = []
+    laptop_updates = []
+    returned_laptop_ids = []
+    returned_date = datetime.utcnow()
+    async for assignment in db.Assignments.aggregate(pipeline):
+        result = results[assignment["employeeId"]]
+        if not assignment["laptopFound"]:
+            logging.warning(f"Laptop with ID {assignment['laptopId']} not found.")
+            result["missingLaptops"].append(assignment["laptopId"])
+            continue
+
+        assignment_updates.append(UpdateOne(
+            {"_id": assignment["_id"], "status": "Active"},
+            {"$set": {"returnedDate": returned_date, "status": "Returned"}}
+        ))
+        laptop_updates.append(UpdateOne(
+            {"_id": assignment["laptopObjectId"]},
+            {"$set": {"status": "Available"}}
+        ))
+        returned_laptop_ids.append(assignment["laptopObjectId"])
+        result["returnedLaptops"].append(assignment["laptopId"])
+
+    # Assignments are closed before their laptops become Available, so a failure in between
+    # can never leave a laptop Available while still actively assigned
+    if assignment_updates:
+        result = await db.Assignments.bulk_write(assignment_updates, ordered=True)
+        if result.matched_count != len(assignment_updates):
+            logging.warning(f"{len(assignment_updates) - result.matched_count} assignments were not found for update.")
+
+        result = await db.Laptops.bulk_write(laptop_updates, ordered=True)
+        if result.matched_count != len(laptop_updates):
+            logging.warning(f"{len(laptop_updates) - result.matched_count} laptops were not found for update.")
+        for laptop_id in returned_laptop_ids:
+            set_laptop_status(laptop_id, "Available")
+
+    return [results[employee_id] for employee_id in employee_ids]
+
+
+@app.route('/api/offboard', methods=['POST'])
+async def offboard_employee():
+    try:
+        data = await request.get_json()
+        employee_id = data.get('employeeId')
+
+        if not employee_id:
+            return jsonify({"error": "Employee ID is required"}), 400
+
+        result = (await offboard_employees([employee_id]))[0]
+        if not result["returnedLaptops"] and not result["missingLaptops"]:
+            return jsonify({"message": "No active assignments found for this employee"}), 404
+
+        return jsonify({"message": "Employee offboarding processed successfully"})
+
+    except Exception as e:
+        logging.error(f"Error in /api/offboard: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+
+@app.route('/api/forecast_demand', methods=['GET'])
+async def forecast_laptop_demand():
+    try:
+        try:
+            params = forecast_params(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # The watermark is checked asynchronously; the cache lookup (a stat, and a pickle load when the
+        # model changed) and any recompute run with the sync driver on the CPU pool, off the loop
+        watermark = await assignments_watermark_async(db)
+        if params is not None:
+            result = await run_cpu(grouped_forecast_cache.get, sync_db, *params, watermark)
+            body = result.forecast
+        else:
+            result = await run_cpu(forecast_cache.get, sync_db, watermark)
+            if result is None:
+                return jsonify({"error": "Demand forecasting model not available."}), 500
+            body = {"demandForecast": result.forecast}
+
+        if result.etag in request.if_none_match or (
+            not request.if_none_match and request.if_modified_since is not None and result.last_modified is not None
+            and result.last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+        ):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(body)
+        response.set_etag(result.etag)
+        response.last_modified = result.last_modified
+        response.cache_control.no_cache = True
+        return response
+
+    except Exception as e:
+        logging.error(f"Error in /api/forecast_demand: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+
+@app.route('/api/predict/stats', methods=['GET'])
+async def predict_stats():
+    return jsonify(predict_batcher.stats())
+
+
+@app.route('/api/jobs/stats', methods=['GET'])
+async def job_stats():
+    return jsonify(job_worker.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    return app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+async def cache_stats():
+    return jsonify({
+        "laptops": laptop_cache.stats(),
+        "employees": employee_cache.stats(),
+        "forecast": {"hits": forecast_cache.hits, "misses": forecast_cache.misses},
+        "groupedForecast": {"hits": grouped_forecast_cache.hits, "misses": grouped_forecast_cache.misses}
+    })
+
+
+if __name__ == '__main__':
+    app.run()
@@ -0,0 +1,115 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from instrumentation import span
+from metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_WAIT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+class _Pending:
+    __slots__ = ('record', 'future', 'enqueued')
+
+    def __init__(self, record):
+        self.record = record
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class PredictBatcher:
+    # Coalesces concurrent single-row predictions into one encode_many + predict call.
+    # A batch closes when it has max_batch rows or window seconds after its first row
+    # arrived, whichever comes first; window=0 only takes rows that are already queued.
+    # Every row in a batch is predicted by the same model version.
+
+    def __init__(self, model_store, max_batch=64, window=0.002):
+        self.model_store = model_store
+        self.max_batch = max_batch
+        self.window = window
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait = Histogram(QUEUE_WAIT_BUCKETS)
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # Started lazily, and again after a fork, since threads do not survive fork
+        pid = os.getpid()
+        if self._thread is None or self._pid != pid:
+            with self._lock:
+                if self._thread is None or self._pid != pid:
+                    self._queue = queue.Queue()
+                    self._thread = threading.Thread(target=self._run, args=(self._queue,), name='predict-batcher', daemon=True)
+                    self._thread.start()
+                    self._pid = pid
+        return self._queue
+
+    def submit(self, record):
+        # Queue one requirements record; the Future resolves to its laptop id string (or None)
+        pending = _Pending(record)
+        self._ensure_worker().put(pending)
+        return pending.future
+
+    def predict(self, record, timeout=None):
+        if self.max_batch <= 1:
+            return self.predict_many([record])[0]
+        return self.submit(record).result(timeout)
+
+    def predict_many(self, records, endpoint=None):
+        current = self.model_store.current()
+        with span('encode', endpoint):
+            rows = current.encoder.encode_many(records)
+        with span('model_predict', endpoint):
+            predictions = current.model.predict(rows)
+        return [current.id_mapping.get(prediction, None) for prediction in predictions]
+
+    def stop(self):
+        if self._queue is not None:
+            self._queue.put(None)
+
+    def _run(self, pending_queue):
+        while True:
+            first = pending_queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first.enqueued + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = pending_queue.get(timeout=remaining) if remaining > 0 else pending_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    pending_queue.put(None)
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        started = time.monotonic()
+        self.batch_sizes.observe(len(batch))
+        self.queue_wait.observe_many(started - item.enqueued for item in batch)
+        try:
+            laptop_ids = self.predict_many([item.record for item in batch], endpoint='predict_batcher')
+        except Exception as e:
+            logging.error(f"Error in batched predict: {e}")
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        for item, laptop_id in zip(batch, laptop_ids):
+            item.future.set_result(laptop_id)
+
+    def stats(self):
+        return {
+            "maxBatch": self.max_batch,
+            "windowMs": self.window * 1000.0,
+            "batchSize": self.batch_sizes.snapshot(),
+            "queueWaitSeconds": self.queue_wait.snapshot()
+        }
@@ -0,0 +1,67 @@
+import argparse
+import json
+import random
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from batcher import PredictBatcher
+from model_artifact import ModelStore, load_pickle
+
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+SAMPLE_REQUESTS = [
+    {'cpu': 'Intel Core i7', 'ram': '16GB', 'storage': '512GB SSD'},
+    {'cpu': 'Intel Core i5', 'ram': '8GB', 'storage': '256GB SSD'},
+    {'cpu': 'Apple M1', 'ram': '8GB', 'storage': '256GB SSD'},
+    {'cpu': 'AMD Ryzen 7', 'ram': '16GB', 'storage': '1TB SSD'},
+]
+
+
+def run(workers, records, predict):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(predict, records))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request predict with the micro-batching coalescer")
+    parser.add_argument('--artifacts', default='model_artifacts')
+    parser.add_argument('--model', default='laptop_recommendation_model.pkl', help="legacy pickle, used when no artifact is published")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--window-ms', type=float, nargs='+', default=[0, 1, 2, 5])
+    parser.add_argument('--output', help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    store = ModelStore(args.artifacts)
+    if not store.reload():
+        store.set(load_pickle(args.model))
+    rng = random.Random(42)
+    records = [rng.choice(SAMPLE_REQUESTS) for _ in range(args.requests)]
+
+    unbatched = PredictBatcher(store, max_batch=1)
+    elapsed = run(args.workers, records, unbatched.predict)
+    results = {"unbatched": {"requestsPerSecond": len(records) / elapsed}}
+    print(f"{'unbatched':<18} {results['unbatched']['requestsPerSecond']:9.1f} req/s")
+
+    for window_ms in args.window_ms:
+        batcher = PredictBatcher(store, max_batch=args.max_batch, window=window_ms / 1000.0)
+        elapsed = run(args.workers, records, batcher.predict)
+        batcher.stop()
+        stats = batcher.stats()
+        name = f"batched/{window_ms:g}ms"
+        results[name] = {"requestsPerSecond": len(records) / elapsed, **stats}
+        print(f"{name:<18} {results[name]['requestsPerSecond']:9.1f} req/s  "
+              f"batch p50={stats['batchSize']['p50']:.1f} p99={stats['batchSize']['p99']:.1f}  "
+              f"wait p95={stats['queueWaitSeconds']['p95'] * 1000:.2f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"args": vars(args), "results": results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import pickle
+import time
+import warnings
+
+import pandas as pd
+from bson import json_util
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import LabelEncoder
+
+from feature_encoder import FeatureEncoder
+from spec_features import SpecEncoder, parse_specs_many
+
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+SAMPLE_REQUEST = {'cpu': 'Intel Core i7', 'ram': '16GB', 'storage': '512GB SSD'}
+
+
+# Per-request encoding as app.py did it before the compiled encoder
+def pandas_encode(record, label_encoders):
+    employee_df = pd.DataFrame([record])
+    for column, le in label_encoders.items():
+        if column in employee_df.columns:
+            employee_df[column] = employee_df[column].apply(lambda x: le.transform([x])[0] if pd.notna(x) and x in le.classes_ else -1)
+    for column in employee_df.columns:
+        if column in label_encoders:
+            employee_df[column] = employee_df[column].astype(int)
+        else:
+            employee_df[column] = employee_df[column].astype(float)
+    return employee_df
+
+
+def fit_models(path):
+    # The label-encoded model app.py served before specs were parsed, and the spec-encoded one,
+    # both fitted on the seed laptops so the comparison does not depend on which pickle is on disk
+    with open(path) as file:
+        records = [laptop['specifications'] for laptop in json_util.loads(file.read())]
+    targets = list(range(len(records)))
+    frame = pd.DataFrame(records)[['cpu', 'ram', 'storage']]
+    label_encoders = {}
+    for column in frame.columns:
+        label_encoders[column] = LabelEncoder()
+        frame[column] = label_encoders[column].fit_transform(frame[column])
+    label_model = KNeighborsClassifier(n_neighbors=1).fit(frame, targets)
+    spec_encoder = SpecEncoder.fit(parse_specs_many(records))
+    spec_model = KNeighborsClassifier(n_neighbors=1).fit(spec_encoder.encode_many(records), targets)
+    return (label_model, label_encoders), (spec_model, spec_encoder)
+
+
+def time_per_call(func, iterations):
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark request encoding and prediction")
+    parser.add_argument('--model', help="time this pickle instead of the model of the same encoding fitted on the seed laptops")
+    parser.add_argument('--laptops', default='LAMP.Laptops.json', help="seed laptops the comparison models are fitted on")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    (label_model, label_encoders), (spec_model, spec_encoder) = fit_models(args.laptops)
+    if args.model:
+        with open(args.model, 'rb') as file:
+            model, encoder, id_mapping = pickle.load(file)
+        if isinstance(encoder, dict):
+            label_model, label_encoders = model, encoder
+        else:
+            spec_model, spec_encoder = model, encoder
+
+    # Baseline: per-request pandas/LabelEncoder encoding, then the compiled label encoder
+    encoder = FeatureEncoder.from_model(label_model, label_encoders)
+    record = {column: SAMPLE_REQUEST.get(column, 0) for column in encoder.feature_columns}
+
+    results = {
+        'encode (pandas)': time_per_call(lambda: pandas_encode(record, label_encoders), args.iterations),
+        'encode (compiled)': time_per_call(lambda: encoder.encode(record), args.iterations),
+        'encode (spec)': time_per_call(lambda: spec_encoder.encode(SAMPLE_REQUEST), args.iterations),
+        'encode+predict (pandas)': time_per_call(lambda: label_model.predict(pandas_encode(record, label_encoders)), args.iterations),
+        'encode+predict (compiled)': time_per_call(lambda: label_model.predict(encoder.encode(record)), args.iterations),
+        'encode+predict (spec)': time_per_call(lambda: spec_model.predict(spec_encoder.encode(SAMPLE_REQUEST)), args.iterations),
+    }
+    for name, micros in results.items():
+        print(f"{name:<28} {micros:10.1f} us/request")
+    for variant in ('compiled', 'spec'):
+        print(f"{f'encode speedup ({variant}):':<36} {results['encode (pandas)'] / results[f'encode ({variant})']:.1f}x")
+        print(f"{f'encode+predict speedup ({variant}):':<36} {results['encode+predict (pandas)'] / results[f'encode+predict ({variant})']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
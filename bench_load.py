@@ -0,0 +1,293 @@
+import argparse
+import json
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mongomock
+import numpy as np
+from bson import ObjectId, json_util
+from pymongo import monitoring
+
+import config
+from bench_reservations import SerializedDatabase
+
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+ENDPOINTS = ['recommendations', 'recommendations/available', 'reserve', 'onboard', 'offboard', 'forecast_demand']
+
+# These aggregate with $convert/$dateTrunc, which mongomock does not implement; they only run against a mongod
+MONGOD_ONLY_ENDPOINTS = {'offboard', 'forecast_demand'}
+
+
+class CommandCounter(monitoring.CommandListener):
+    # Counts MongoDB commands: registered as a pymongo listener for a real mongod, or called
+    # directly by the mongomock stand-in for every collection method
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def total(self):
+        with self._lock:
+            return sum(self.counts.values())
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def started(self, event):
+        self.count(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def insert_in_batches(collection, documents, batch_size):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def scale_seed(db, n_laptops, n_employees, n_assignments, active_ratio=0.2, months=24, batch_size=10000, seed=42):
+    # Scale the LAMP.*.json seed data up to the requested sizes, streaming inserts in batches.
+    # The seed laptops keep their _ids so the trained model's predictions resolve.
+    rng = random.Random(seed)
+    with open('LAMP.Laptops.json') as file:
+        laptop_templates = json_util.loads(file.read())
+    with open('LAMP.Employees.json') as file:
+        employee_templates = json_util.loads(file.read())
+    for name in ('Laptops', 'Employees', 'Assignments', 'Reservations'):
+        db[name].drop()
+
+    laptop_ids = [laptop_templates[i]["_id"] if i < len(laptop_templates) else ObjectId(f"{i:024x}") for i in range(n_laptops)]
+    employee_ids = [ObjectId(f"e{i:023x}") for i in range(n_employees)]
+
+    # Active assignments hold distinct laptops, at most half the fleet, so onboarding has stock
+    n_active = min(int(n_assignments * active_ratio), n_laptops // 2)
+    active_laptops = set(rng.sample(range(n_laptops), n_active))
+
+    insert_in_batches(db.Laptops, (
+        {**laptop_templates[i % len(laptop_templates)], "_id": laptop_ids[i], "serialNumber": f"LOAD{i:07d}",
+         "status": "Assigned" if i in active_laptops else "Available"}
+        for i in range(n_laptops)
+    ), batch_size)
+    insert_in_batches(db.Employees, (
+        {**employee_templates[i % len(employee_templates)], "_id": employee_ids[i], "name": f"employee-{i}",
+         "email": f"employee-{i}@example.com"}
+        for i in range(n_employees)
+    ), batch_size)
+
+    start = datetime.utcnow() - timedelta(days=months * 30)
+    active_employees = []
+
+    def assignments():
+        active = iter(sorted(active_laptops))
+        for i in range(n_assignments):
+            assigned = start + timedelta(days=rng.randrange(months * 30))
+            employee_id = str(employee_ids[rng.randrange(n_employees)])
+            laptop = next(active, None) if i < n_active else None
+            if laptop is not None:
+                active_employees.append(employee_id)
+                yield {"employeeId": employee_id, "laptopId": str(laptop_ids[laptop]), "assignedDate": assigned.strftime('%Y-%m-%d'),
+                       "returnedDate": None, "status": "Active"}
+            else:
+                yield {"employeeId": employee_id, "laptopId": str(laptop_ids[rng.randrange(n_laptops)]), "assignedDate": assigned.strftime('%Y-%m-%d'),
+                       "returnedDate": (assigned + timedelta(days=rng.randrange(30, 365))).strftime('%Y-%m-%d'), "status": "Returned"}
+
+    insert_in_batches(db.Assignments, assignments(), batch_size)
+    return {
+        "laptopIds": laptop_ids,
+        "employeeNames": [f"employee-{i}" for i in range(n_employees)],
+        "activeEmployeeIds": list(dict.fromkeys(active_employees)),
+        "specs": [laptop["specifications"] for laptop in laptop_templates]
+    }
+
+
+def payloads(endpoint, n, data, rng):
+    def spec():
+        chosen = rng.choice(data["specs"])
+        return {key: chosen[key] for key in ('cpu', 'ram', 'storage')}
+
+    if endpoint == 'recommendations':
+        return [spec() for _ in range(n)]
+    if endpoint == 'recommendations/available':
+        return [{**spec(), "k": 5} for _ in range(n)]
+    if endpoint == 'reserve':
+        return [{"name": rng.choice(data["employeeNames"]), "laptopId": str(rng.choice(data["laptopIds"]))} for _ in range(n)]
+    if endpoint == 'onboard':
+        return [{"_id": f"load-hire-{i}", **spec()} for i in range(n)]
+    if endpoint == 'offboard':
+        employees = data["activeEmployeeIds"] or ["nobody"]
+        return [{"employeeId": employees[i % len(employees)]} for i in range(n)]
+    return [None] * n
+
+
+def summarize(latencies, statuses, elapsed, commands):
+    # Throughput and latency count successful (2xx) responses only; failures are reported, not timed
+    ok_ms = np.asarray([latency for latency, status in latencies if 200 <= status < 300]) * 1000.0
+    return {
+        "requests": len(latencies),
+        "successful": len(ok_ms),
+        "seconds": elapsed,
+        "requestsPerSecond": len(ok_ms) / elapsed,
+        "latencyMs": {
+            "p50": float(np.percentile(ok_ms, 50)),
+            "p95": float(np.percentile(ok_ms, 95)),
+            "p99": float(np.percentile(ok_ms, 99)),
+            "mean": float(ok_ms.mean()),
+            "max": float(ok_ms.max())
+        } if len(ok_ms) else None,
+        "statusCodes": {str(code): count for code, count in sorted(statuses.items())},
+        "serverErrors": sum(count for code, count in statuses.items() if code >= 500),
+        "mongoCommandsPerRequest": commands / len(latencies) if commands is not None else None
+    }
+
+
+def drive(send, requests, concurrency):
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def one(payload):
+        start = time.perf_counter()
+        status = send(payload)
+        latency = time.perf_counter() - start
+        with lock:
+            latencies.append((latency, status))
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, requests))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the LAMP API endpoints against scaled seed data")
+    parser.add_argument('--laptops', type=int, default=1000)
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--assignments', type=int, default=20000)
+    parser.add_argument('--mongo-uri', help="seed and serve from this mongod instead of mongomock")
+    parser.add_argument('--db-name', default='LAMP_load')
+    parser.add_argument('--url', help="drive a running server at this base URL instead of the in-process app")
+    parser.add_argument('--rtt-ms', type=float, default=0.2, help="simulated round-trip time per command with mongomock")
+    parser.add_argument('--endpoints', nargs='+', default=ENDPOINTS, choices=ENDPOINTS,
+                        help=f"{', '.join(sorted(MONGOD_ONLY_ENDPOINTS))} need --mongo-uri")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    if args.mongo_uri:
+        # Register before the client exists so every command of the app and the seeding is seen
+        monitoring.register(counter)
+        config.MONGO_URI = args.mongo_uri
+        config.MONGO_DB_NAME = args.db_name
+        db = config.get_db()
+    else:
+        db = SerializedDatabase(mongomock.MongoClient()[args.db_name], args.rtt_ms / 1000.0, on_command=counter.count)
+        config.get_db = lambda: db
+
+    start = time.perf_counter()
+    data = scale_seed(db, args.laptops, args.employees, args.assignments, seed=args.seed)
+    print(f"seeded {args.laptops} laptops, {args.employees} employees, {args.assignments} assignments in {time.perf_counter() - start:.1f}s")
+
+    if args.url:
+        def make_sender(endpoint):
+            def send(payload):
+                body = json.dumps(payload).encode() if payload is not None else None
+                req = urllib.request.Request(f"{args.url.rstrip('/')}/api/{endpoint}", data=body, headers={"Content-Type": "application/json"})
+                try:
+                    with urllib.request.urlopen(req) as response:
+                        response.read()
+                        return response.status
+                except urllib.error.HTTPError as e:
+                    return e.code
+            return send
+    else:
+        # Import after the database is patched, so the app connects to the seeded stand-in
+        # Keep background jobs (reservation expiry, retraining) out of the measurement
+        config.BACKGROUND_JOBS = False
+        import app as app_module
+        app_module.warmup.ensure(*app_module.READY_COMPONENTS)
+        local = threading.local()
+
+        def make_sender(endpoint):
+            def send(payload):
+                if not hasattr(local, 'client'):
+                    local.client = app_module.app.test_client()
+                if payload is None:
+                    return local.client.get(f"/api/{endpoint}").status_code
+                return local.client.post(f"/api/{endpoint}", json=payload).status_code
+            return send
+
+    endpoints = args.endpoints
+    if not args.mongo_uri:
+        skipped = [endpoint for endpoint in endpoints if endpoint in MONGOD_ONLY_ENDPOINTS]
+        if skipped:
+            print(f"skipping {', '.join(skipped)}: mongomock cannot run their aggregations, pass --mongo-uri")
+        endpoints = [endpoint for endpoint in endpoints if endpoint not in MONGOD_ONLY_ENDPOINTS]
+
+    rng = random.Random(args.seed)
+    results = {}
+    for endpoint in endpoints:
+        requests = payloads(endpoint, args.requests, data, rng)
+        counter.reset()
+        latencies, statuses, elapsed = drive(make_sender(endpoint), requests, args.concurrency)
+        # Commands are only attributable to requests when the app runs in this process
+        commands = counter.total() if not args.url else None
+        results[endpoint] = summarize(latencies, statuses, elapsed, commands)
+        result = results[endpoint]
+        round_trips = f"{result['mongoCommandsPerRequest']:.2f}" if result['mongoCommandsPerRequest'] is not None else "n/a"
+        latency = result['latencyMs']
+        timings = (f"p50={latency['p50']:7.2f}ms p95={latency['p95']:7.2f}ms p99={latency['p99']:7.2f}ms"
+                   if latency is not None else f"{'no successful responses':<44}")
+        print(f"{endpoint:<26} {result['requestsPerSecond']:8.1f} req/s  {timings}  "
+              f"mongo/req={round_trips}  ok={result['successful']}/{result['requests']}  status={result['statusCodes']}"
+              f"{'  SERVER ERRORS' if result['serverErrors'] else ''}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                "revision": git_revision(),
+                "createdAt": datetime.utcnow().isoformat(),
+                "args": vars(args),
+                "results": results
+            }, file, indent=2)
+
+    # A run with server errors did not measure what it claims to
+    if any(result['serverErrors'] for result in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
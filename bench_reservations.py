@@ -0,0 +1,207 @@
+import argparse
+import json
+import random
+import threading
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import mongomock
+from bson import ObjectId, json_util
+
+import config
+
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+
+class SerializedCollection:
+    # mongomock runs each command as several Python steps, so unlike a real mongod a single
+    # find_one_and_update is not atomic across threads. Serializing every command restores
+    # per-command atomicity, and a simulated round-trip time models the network cost.
+
+    def __init__(self, collection, lock, rtt, on_command=None):
+        self._collection = collection
+        self._lock = lock
+        self._rtt = rtt
+        self._on_command = on_command
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def command(*args, **kwargs):
+            if self._on_command is not None:
+                self._on_command(name)
+            time.sleep(self._rtt)
+            with self._lock:
+                result = attr(*args, **kwargs)
+                # Materialize cursors while holding the lock
+                return list(result) if isinstance(result, mongomock.collection.Cursor) else result
+        return command
+
+
+class SerializedDatabase:
+    def __init__(self, db, rtt, on_command=None):
+        self._db = db
+        self._lock = threading.Lock()
+        self._rtt = rtt
+        self._on_command = on_command
+        self._collections = {}
+
+    def command(self, *args, **kwargs):
+        return self._db.command(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = SerializedCollection(self._db[name], self._lock, self._rtt, self._on_command)
+        return self._collections[name]
+
+
+def seed(db, n_laptops, n_employees):
+    with open('LAMP.Laptops.json') as file:
+        templates = json_util.loads(file.read())
+    for name in ('Laptops', 'Employees', 'Assignments', 'Reservations'):
+        db[name].drop()
+    db.Laptops.insert_many([
+        # The first laptops keep their seed ids so the trained model's predictions resolve
+        {**templates[i % len(templates)], "_id": templates[i]["_id"] if i < len(templates) else ObjectId(f"{i:024x}"),
+         "serialNumber": f"BENCH{i:06d}", "status": "Available"}
+        for i in range(n_laptops)
+    ])
+    db.Employees.insert_many([{"name": f"employee-{i}"} for i in range(n_employees)])
+    return [laptop["_id"] for laptop in db.Laptops.find({}, {"_id": 1})], [f"employee-{i}" for i in range(n_employees)]
+
+
+# Reservation flow as app.py implemented it before the atomic claim: read, check, insert, update
+def legacy_reserve(db, employee_name, laptop_id):
+    employee = db.Employees.find_one({"name": employee_name})
+    laptop = db.Laptops.find_one({"_id": laptop_id})
+    if not employee or not laptop or laptop["status"] != "Available":
+        return False
+    db.Reservations.insert_one({"employeeId": str(employee["_id"]), "laptopId": str(laptop["_id"]), "reservedDate": datetime.utcnow(), "status": "Reserved"})
+    db.Laptops.update_one({"_id": laptop["_id"]}, {"$set": {"status": "Reserved"}})
+    return True
+
+
+# Onboarding flow as app.py implemented it before the atomic claim
+def legacy_onboard(app_module, db, record):
+    current = app_module.model_store.current()
+    predicted = current.model.predict(current.encoder.encode(record))[0]
+    laptop_id = ObjectId(current.id_mapping[predicted])
+    laptop = db.Laptops.find_one({"_id": laptop_id, "status": "Available"})
+    if not laptop:
+        return False
+    db.Assignments.insert_one({"employeeId": record["_id"], "laptopId": str(laptop_id), "status": "Active", "assignedDate": datetime.utcnow()})
+    db.Laptops.update_one({"_id": laptop_id}, {"$set": {"status": "Assigned"}})
+    return True
+
+
+def run(workers, jobs):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda job: job(), jobs))
+    return time.perf_counter() - start, sum(1 for ok in results if ok)
+
+
+def double_claims(collection, query):
+    counts = Counter(doc["laptopId"] for doc in collection.find(query, {"laptopId": 1}))
+    return sum(count - 1 for count in counts.values() if count > 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency stress test for laptop reservation and onboarding")
+    parser.add_argument('--laptops', type=int, default=50)
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help="simulated MongoDB round-trip time per command")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db = SerializedDatabase(mongomock.MongoClient()["LAMP"], args.rtt_ms / 1000.0)
+    laptop_ids, employee_names = seed(db, args.laptops, args.employees)
+
+    # Point the app at the stand-in database before it connects
+    config.get_db = lambda: db
+    # Keep background jobs (reservation expiry, retraining) out of the measurement
+    config.BACKGROUND_JOBS = False
+    import app as app_module
+    from flask import jsonify, request
+    from laptop_index import LaptopIndex
+    app_module.warmup.ensure(*app_module.READY_COMPONENTS)
+
+    # Serve the legacy flows through Flask too, so both sides pay the same per-request overhead
+    def legacy_reserve_view():
+        data = request.get_json()
+        ok = legacy_reserve(db, data["name"], ObjectId(data["laptopId"]))
+        return jsonify({"ok": ok}), 200 if ok else 400
+
+    def legacy_onboard_view():
+        ok = legacy_onboard(app_module, db, request.get_json())
+        return jsonify({"ok": ok}), 200 if ok else 404
+
+    app_module.app.add_url_rule('/bench/legacy/reserve', view_func=legacy_reserve_view, methods=['POST'])
+    app_module.app.add_url_rule('/bench/legacy/onboard', view_func=legacy_onboard_view, methods=['POST'])
+
+    with open('LAMP.Laptops.json') as file:
+        specs = [laptop["specifications"] for laptop in json_util.loads(file.read())]
+    reserve_load = [(rng.choice(employee_names), rng.choice(laptop_ids)) for _ in range(args.requests)]
+    onboard_load = [{"_id": f"hire-{i}", **{k: rng.choice(specs)[k] for k in ('cpu', 'ram', 'storage')}} for i in range(args.requests)]
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app_module.app.test_client()
+        return local.client
+
+    def reset():
+        seed(db, args.laptops, args.employees)
+        app_module.laptop_cache.clear()
+        app_module.employee_cache.clear()
+        app_module.laptop_index = LaptopIndex.from_collection(db.Laptops, app_module.model_store.current().encoder)
+
+    def post(path, payload):
+        return lambda: client().post(path, json=payload).status_code == 200
+
+    scenarios = {
+        "reserve/legacy": ([post('/bench/legacy/reserve', {"name": n, "laptopId": str(l)}) for n, l in reserve_load], "Reservations", {}),
+        "reserve/atomic": ([post('/api/reserve', {"name": n, "laptopId": str(l)}) for n, l in reserve_load], "Reservations", {}),
+        "onboard/legacy": ([post('/bench/legacy/onboard', r) for r in onboard_load], "Assignments", {"status": "Active"}),
+        "onboard/atomic": ([post('/api/onboard', r) for r in onboard_load], "Assignments", {"status": "Active"}),
+    }
+
+    results = {}
+    for name, (jobs, collection, query) in scenarios.items():
+        reset()
+        elapsed, succeeded = run(args.workers, jobs)
+        results[name] = {
+            "requests": len(jobs),
+            "seconds": elapsed,
+            "requestsPerSecond": len(jobs) / elapsed,
+            "succeeded": succeeded,
+            "doubleAssignments": double_claims(db[collection], query)
+        }
+        print(f"{name:<16} {results[name]['requestsPerSecond']:9.1f} req/s  succeeded={succeeded:<5} double-assignments={results[name]['doubleAssignments']}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"args": vars(args), "results": results}, file, indent=2)
+
+    # Fail loudly if the atomic flows ever hand out the same laptop twice
+    if any(result["doubleAssignments"] for name, result in results.items() if name.endswith("/atomic")):
+        raise SystemExit("atomic flows produced double assignments")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'sklearn']
+
+
+def max_rss_mb():
+    # Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def child(args):
+    # One cold start, in a fresh interpreter: import the app module, then wait until it is warm
+    sys.path.insert(0, os.getcwd())
+    started = time.perf_counter()
+    import config
+    if args.mongo_uri:
+        config.MONGO_URI = args.mongo_uri
+    else:
+        import mongomock
+        from bson import json_util
+        db = mongomock.MongoClient()["LAMP"]
+        for name in ('Laptops', 'Employees', 'Assignments'):
+            with open(f'LAMP.{name}.json') as file:
+                db[name].insert_many(json_util.loads(file.read()))
+        config.get_db = lambda: db
+    setup = time.perf_counter() - started
+
+    started = time.perf_counter()
+    module = __import__(args.module)
+    imported = time.perf_counter() - started
+    result = {
+        "importSeconds": imported,
+        "importRssMb": max_rss_mb(),
+        "heavyModulesAtImport": [name for name in HEAVY_MODULES if name in sys.modules]
+    }
+
+    # Apps without a warm-up finish loading at import
+    warmup = getattr(module, 'warmup', None)
+    if warmup is not None:
+        ready = warmup.wait(args.timeout)
+        result["readySeconds"] = time.perf_counter() - started if ready else None
+    else:
+        result["readySeconds"] = imported
+    result["readyRssMb"] = max_rss_mb()
+    result["setupSeconds"] = setup
+    print(json.dumps(result))
+    os._exit(0)
+
+
+def run(args, tree):
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--module', args.module, '--timeout', str(args.timeout)]
+    if args.mongo_uri:
+        command += ['--mongo-uri', args.mongo_uri]
+    env = dict(os.environ, LAMP_BACKGROUND_JOBS='0', LAMP_MODEL_WATCH_INTERVAL='0')
+    output = subprocess.run(command, cwd=tree, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def interpreter_rss_mb():
+    output = subprocess.run(
+        [sys.executable, '-c', 'import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'],
+        capture_output=True, text=True, check=True
+    ).stdout
+    rss = int(output)
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure cold-start import time, time to ready and peak RSS of the API process")
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--trees', nargs='+', default=['.'],
+                        help="checkouts to compare, e.g. . and a `git worktree add` of the previous revision")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds to wait for the warm-up")
+    parser.add_argument('--mongo-uri', help="connect to this mongod instead of a seeded mongomock stand-in")
+    parser.add_argument('--output', help="write results as JSON to this path")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+
+    print(f"bare interpreter: {interpreter_rss_mb():.1f} MB")
+    results = {}
+    for tree in args.trees:
+        runs = [run(args, tree) for _ in range(args.runs)]
+        ready = [r["readySeconds"] for r in runs if r["readySeconds"] is not None]
+        results[tree] = {
+            "importSecondsMedian": statistics.median(r["importSeconds"] for r in runs),
+            "readySecondsMedian": statistics.median(ready) if ready else None,
+            "importRssMb": max(r["importRssMb"] for r in runs),
+            "readyRssMb": max(r["readyRssMb"] for r in runs),
+            "heavyModulesAtImport": runs[-1]["heavyModulesAtImport"],
+            "runs": runs
+        }
+        result = results[tree]
+        ready_text = f"{result['readySecondsMedian']:.3f}s" if result['readySecondsMedian'] is not None else "timeout"
+        print(f"{tree:<24} import={result['importSecondsMedian']:.3f}s rss={result['importRssMb']:.1f}MB  "
+              f"ready={ready_text} rss={result['readyRssMb']:.1f}MB  heavy at import={','.join(result['heavyModulesAtImport']) or '-'}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+class DocumentCache:
+    # Thread-safe LRU cache of MongoDB documents with a per-entry TTL and hit/miss counters
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                document, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return document
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def peek(self, key):
+        # Return the cached document without touching counters, LRU order or expiry
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def get_or_load(self, key, loader):
+        # Read-through: serve from cache, otherwise call loader and cache what it returns
+        document = self.get(key)
+        if document is None:
+            document = loader()
+            if document is not None:
+                self.put(key, document)
+        return document
+
+    def put(self, key, document):
+        with self._lock:
+            self._entries[key] = (document, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, fields):
+        # Write-through for $set updates: refresh the cached copy if there is one
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = ({**entry[0], **fields}, self._clock() + self.ttl)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_matching(self, field, value):
+        with self._lock:
+            for key in [key for key, (document, _) in self._entries.items() if document.get(field) == value]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxSize": self.maxsize,
+            "ttl": self.ttl
+        }
+
+
+class ChangeFollower:
+    # Keeps a DocumentCache coherent with changes made by other processes.
+    # Follows a change stream when the deployment supports one (replica sets),
+    # otherwise polls the cached keys with a single $in query every poll_interval seconds.
+    # With poll_fields, polling also scans those fields of every document, cached or not, so
+    # on_change/on_delete see changes to the whole collection in both modes.
+
+    def __init__(self, collection, cache, key_field="_id", poll_interval=5.0, on_change=None, on_delete=None, poll_fields=None):
+        self.collection = collection
+        self.cache = cache
+        self.key_field = key_field
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.on_delete = on_delete
+        self.poll_fields = tuple(poll_fields) if poll_fields else None
+        self.mode = None
+        self._seen = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"cache-follower-{self.collection.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def restart_after_fork(self):
+        # Threads do not survive fork: pre-fork workers follow changes on their own thread
+        self._stop = threading.Event()
+        self.mode = None
+        self.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            self.mode = "changeStream"
+            self.follow_change_stream()
+        except Exception as e:
+            if self._stop.is_set():
+                return
+            logging.info(f"Change streams unavailable for {self.collection.name} ({e}), falling back to polling")
+        self.mode = "polling"
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                logging.error(f"Error polling {self.collection.name} for cache invalidation: {e}")
+
+    def follow_change_stream(self):
+        with self.collection.watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self.apply_change(change)
+
+    def apply_change(self, change):
+        operation = change.get("operationType")
+        document = change.get("fullDocument")
+        if operation in ("insert", "update", "replace") and document is not None:
+            self._refresh(document)
+        elif operation == "delete":
+            self.cache.invalidate_matching("_id", change["documentKey"]["_id"])
+            if self.on_delete is not None:
+                self.on_delete(change["documentKey"]["_id"])
+        elif operation in ("drop", "invalidate"):
+            self.cache.clear()
+
+    def poll_once(self):
+        # Re-read every cached document in one query and refresh or drop the ones that changed
+        keys = self.cache.keys()
+        changed = 0
+        refreshed = set()
+        if keys:
+            current = {document[self.key_field]: document for document in self.collection.find({self.key_field: {"$in": keys}})}
+            for key in keys:
+                document = current.get(key)
+                if document is None:
+                    self.cache.invalidate(key)
+                    changed += 1
+                elif self.cache.peek(key) != document:
+                    self._refresh(document)
+                    refreshed.add(document["_id"])
+                    changed += 1
+        if self.poll_fields:
+            changed += self.poll_fields_once(refreshed)
+        return changed
+
+    def poll_fields_once(self, refreshed=()):
+        # Scan poll_fields of the whole collection and compare with the previous scan: new or changed
+        # documents are re-read in one $in query and refreshed, vanished ones go to on_delete.
+        # The first scan only records the baseline.
+        projection = dict.fromkeys(self.poll_fields, 1)
+        seen = {document["_id"]: tuple(document.get(field) for field in self.poll_fields)
+                for document in self.collection.find({}, projection)}
+        previous, self._seen = self._seen, seen
+        if previous is None:
+            return 0
+        changed_ids = [_id for _id, values in seen.items() if previous.get(_id) != values and _id not in refreshed]
+        for document in self.collection.find({"_id": {"$in": changed_ids}}) if changed_ids else ():
+            self._refresh(document)
+        deleted_ids = [_id for _id in previous if _id not in seen]
+        for _id in deleted_ids:
+            self.cache.invalidate_matching("_id", _id)
+            if self.on_delete is not None:
+                self.on_delete(_id)
+        return len(changed_ids) + len(deleted_ids)
+
+    def _refresh(self, document):
+        key = document.get(self.key_field)
+        cached = key in self.cache
+        if self.key_field != "_id":
+            # The key field itself may have changed, so drop entries still held under an old key
+            size = len(self.cache)
+            self.cache.invalidate_matching("_id", document["_id"])
+            cached = cached or len(self.cache) < size
+        if cached:
+            self.cache.put(key, document)
+        if self.on_change is not None:
+            self.on_change(document)
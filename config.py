@@ -1,7 +1,157 @@
 # config.py
+import logging
+import os
+import threading
 import pymongo
 
+# Log level for the API processes; per-request DEBUG logging is kept off the hot path
+LOG_LEVEL = os.environ.get("LAMP_LOG_LEVEL", "INFO").upper()
+
+# MongoDB connection
+MONGO_URI = os.environ.get("LAMP_MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB_NAME = os.environ.get("LAMP_MONGO_DB", "LAMP")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("LAMP_MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("LAMP_MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("LAMP_MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("LAMP_MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("LAMP_MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("LAMP_MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("LAMP_MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+# Create the indexes the API's hot queries rely on the first time the database is used
+MONGO_ENSURE_INDEXES = os.environ.get("LAMP_MONGO_ENSURE_INDEXES", "1") == "1"
+
+# Recommendation model: versioned artifact directory, falling back to the legacy pickle
+MODEL_ARTIFACT_DIR = os.environ.get("LAMP_MODEL_ARTIFACT_DIR", "model_artifacts")
+MODEL_PICKLE_PATH = os.environ.get("LAMP_MODEL_PICKLE_PATH", "laptop_recommendation_model.pkl")
+# Seconds between checks for a newly published artifact; 0 disables hot reload
+MODEL_WATCH_INTERVAL = float(os.environ.get("LAMP_MODEL_WATCH_INTERVAL", "5"))
+
+# Threads the async app uses for CPU-bound work (encoding, predict, forecasting) off the event loop
+PREDICT_WORKERS = int(os.environ.get("LAMP_PREDICT_WORKERS", str(os.cpu_count() or 4)))
+
+# Coalesce concurrent single-row predictions: a batch closes after this many rows or this many
+# milliseconds after its first row; LAMP_PREDICT_BATCH_MAX_ROWS=1 predicts inline per request
+PREDICT_BATCH_MAX_ROWS = int(os.environ.get("LAMP_PREDICT_BATCH_MAX_ROWS", "64"))
+PREDICT_BATCH_WINDOW_MS = float(os.environ.get("LAMP_PREDICT_BATCH_WINDOW_MS", "2"))
+
+# Laptop/Employee document cache
+CACHE_SIZE = int(os.environ.get("LAMP_CACHE_SIZE", "4096"))
+CACHE_TTL = float(os.environ.get("LAMP_CACHE_TTL", "300"))
+# Follow change streams (or poll) so the Employee cache sees writes from other processes; Laptops
+# are always followed, since the laptop index depends on it
+CACHE_FOLLOW_CHANGES = os.environ.get("LAMP_CACHE_FOLLOW_CHANGES", "0") == "1"
+CACHE_POLL_INTERVAL = float(os.environ.get("LAMP_CACHE_POLL_INTERVAL", "5"))
+
+# Startup: create_app() warms the database connection, model and laptop index on a background
+# thread, retrying with exponential backoff (seconds) until MongoDB answers. With LAMP_WARM_ON_START=0
+# each part loads on the first request that needs it, and background jobs do not run.
+WARM_ON_START = os.environ.get("LAMP_WARM_ON_START", "1") == "1"
+STARTUP_RETRY_BACKOFF = float(os.environ.get("LAMP_STARTUP_RETRY_BACKOFF", "0.5"))
+STARTUP_RETRY_MAX_BACKOFF = float(os.environ.get("LAMP_STARTUP_RETRY_MAX_BACKOFF", "30"))
+
+# Background jobs: reservation expiry, incremental retraining and forecast precomputation run
+# on a thread pool in every API process; intervals in seconds, 0 disables a job
+BACKGROUND_JOBS = os.environ.get("LAMP_BACKGROUND_JOBS", "1") == "1"
+JOB_WORKERS = int(os.environ.get("LAMP_JOB_WORKERS", "2"))
+RESERVATION_TTL_HOURS = float(os.environ.get("LAMP_RESERVATION_TTL_HOURS", "48"))
+RESERVATION_SWEEP_INTERVAL = float(os.environ.get("LAMP_RESERVATION_SWEEP_INTERVAL", "60"))
+RESERVATION_SWEEP_BATCH = int(os.environ.get("LAMP_RESERVATION_SWEEP_BATCH", "500"))
+RETRAIN_INTERVAL = float(os.environ.get("LAMP_RETRAIN_INTERVAL", "3600"))
+FORECAST_REFRESH_INTERVAL = float(os.environ.get("LAMP_FORECAST_REFRESH_INTERVAL", "300"))
+# Reconcile each process's laptop index with MongoDB, for writes made by other processes
+INDEX_SYNC_INTERVAL = float(os.environ.get("LAMP_INDEX_SYNC_INTERVAL", "30"))
+
+# Indexes backing the hot queries, per collection
+INDEXES = {
+    "Assignments": [
+        [("employeeId", pymongo.ASCENDING), ("status", pymongo.ASCENDING)],
+        [("status", pymongo.ASCENDING), ("assignedDate", pymongo.ASCENDING)],
+        [("laptopId", pymongo.ASCENDING)],
+    ],
+    "Employees": [
+        [("name", pymongo.ASCENDING)],
+    ],
+    "Laptops": [
+        [("status", pymongo.ASCENDING)],
+    ],
+    "Reservations": [
+        [("status", pymongo.ASCENDING), ("reservedDate", pymongo.ASCENDING)],
+    ],
+}
+
+_client = None
+_client_pid = None
+_indexes_ensured = False
+_lock = threading.Lock()
+
+def _reset_after_fork():
+    # A MongoClient must not be used across fork; pre-fork workers (gunicorn --preload)
+    # drop the parent's client and connect lazily on first use in the child
+    global _client, _client_pid, _lock
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_client():
+    # Process-wide pooled client, recreated if the process has forked since it was built
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                _client = pymongo.MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    connect=False
+                )
+                _client_pid = pid
+    return _client
+
+def ensure_indexes(db):
+    for collection, indexes in INDEXES.items():
+        for keys in indexes:
+            db[collection].create_index(keys)
+
+class ForkSafeDatabase:
+    # Database handle that resolves the process-wide client on access, so handles created
+    # at import time in a pre-fork master keep working in every worker
+
+    def __init__(self, name):
+        self._name = name
+        self._pid = None
+        self._database = None
+
+    def _resolve(self):
+        pid = os.getpid()
+        if self._pid != pid or self._database is None:
+            self._database = get_client()[self._name]
+            self._pid = pid
+        return self._database
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
 def get_db():
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["LAMP"]
+    global _indexes_ensured
+    db = ForkSafeDatabase(MONGO_DB_NAME)
+    if MONGO_ENSURE_INDEXES and not _indexes_ensured:
+        try:
+            ensure_indexes(db)
+            _indexes_ensured = True
+        except Exception as e:
+            logging.error(f"Error creating MongoDB indexes: {e}")
     return db
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+ForecastResult = namedtuple('ForecastResult', ['forecast', 'etag', 'last_modified'])
+
+# Month x series demand counts; months are consecutive, starting at the first month with demand.
+# keys name the series: laptopIds, or model/brand/spec values for grouped histories.
+DemandHistory = namedtuple('DemandHistory', ['months', 'keys', 'counts'])
+
+# Grouping levels for demand series. Everything but laptop joins the Laptops document.
+FORECAST_GROUPS = {
+    'laptop': None,
+    'model': {"$ifNull": ["$laptop.model", "unknown"]},
+    'brand': {"$ifNull": ["$laptop.brand", "unknown"]},
+    'spec': {"$concat": [
+        {"$ifNull": ["$laptop.specifications.cpu", "unknown"]}, " / ",
+        {"$ifNull": ["$laptop.specifications.ram", "unknown"]}, " / ",
+        {"$ifNull": ["$laptop.specifications.storage", "unknown"]}
+    ]}
+}
+
+MAX_FORECAST_HORIZON = 60
+
+# Month-of-year seasonality is only fitted once two full years of history exist
+SEASONAL_MIN_MONTHS = 24
+
+
+class DemandModelCache:
+    # Keeps the demand forecasting model in memory and reloads it only when the pickle's mtime changes
+
+    def __init__(self, path='laptop_demand_model.pkl'):
+        self.path = path
+        self.mtime = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logging.error(f"Error loading demand forecasting model: {e}")
+            return None
+        if mtime != self.mtime:
+            with self._lock:
+                if mtime != self.mtime:
+                    try:
+                        with open(self.path, 'rb') as file:
+                            self._model = pickle.load(file)
+                        self.mtime = mtime
+                    except Exception as e:
+                        logging.error(f"Error loading demand forecasting model: {e}")
+                        return None
+        return self._model
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def assignments_watermark(db):
+    # Cheap change marker for the active assignment history: count plus newest assignedDate.
+    # Both queries are served by the (status, assignedDate) index.
+    count = db.Assignments.count_documents({"status": "Active"})
+    latest = db.Assignments.find_one({"status": "Active"}, {"assignedDate": 1}, sort=[("assignedDate", -1)])
+    return count, _as_datetime(latest["assignedDate"]) if latest else None
+
+
+async def assignments_watermark_async(db):
+    # assignments_watermark for an async (Motor) database; both queries run concurrently
+    count, latest = await asyncio.gather(
+        db.Assignments.count_documents({"status": "Active"}),
+        db.Assignments.find_one({"status": "Active"}, {"assignedDate": 1}, sort=[("assignedDate", -1)])
+    )
+    return count, _as_datetime(latest["assignedDate"]) if latest else None
+
+
+def _month_offset(first, month):
+    return (month.year - first.year) * 12 + month.month - first.month
+
+
+def _add_months(month, n):
+    return datetime(month.year + (month.month - 1 + n) // 12, (month.month - 1 + n) % 12 + 1, 1)
+
+
+def history_from_cells(cells):
+    # Build the month x series matrix from (month, key, demand) cells in one pass over them;
+    # cells for the same month and key are summed
+    months, keys, demand = [], [], []
+    for month, key, count in cells:
+        months.append(month)
+        keys.append(str(key))
+        demand.append(count)
+    if not months:
+        return DemandHistory(months=[], keys=[], counts=np.zeros((0, 0)))
+
+    first = min(months)
+    n_months = _month_offset(first, max(months)) + 1
+    columns = sorted(set(keys))
+    index = {key: idx for idx, key in enumerate(columns)}
+    counts = np.zeros((n_months, len(columns)), dtype=np.float64)
+    np.add.at(
+        counts,
+        (np.fromiter((_month_offset(first, month) for month in months), dtype=np.int64, count=len(months)),
+         np.fromiter((index[key] for key in keys), dtype=np.int64, count=len(keys))),
+        np.asarray(demand, dtype=np.float64)
+    )
+    return DemandHistory(months=[_add_months(first, i) for i in range(n_months)], keys=columns, counts=counts)
+
+
+def demand_history(db, status="Active", batch_size=1000, group='laptop'):
+    # Count demand per month and series inside MongoDB and read the aggregated cells in a single
+    # scan, so the assignment history never has to be loaded into Python
+    cells = [
+        {"$match": {"status": status, "assignedDate": {"$ne": None}}},
+        {"$project": {
+            "_id": 0,
+            "laptopId": 1,
+            "month": {"$dateTrunc": {"date": {"$toDate": "$assignedDate"}, "unit": "month"}}
+        }},
+        {"$group": {"_id": {"month": "$month", "key": "$laptopId"}, "demand": {"$sum": 1}}}
+    ]
+    if FORECAST_GROUPS[group] is not None:
+        # Join Laptops once per (month, laptopId) cell rather than once per assignment, then regroup
+        cells += [
+            {"$addFields": {"laptopObjectId": {"$convert": {"input": "$_id.key", "to": "objectId", "onError": None, "onNull": None}}}},
+            {"$lookup": {"from": "Laptops", "localField": "laptopObjectId", "foreignField": "_id", "as": "laptop"}},
+            {"$unwind": {"path": "$laptop", "preserveNullAndEmptyArrays": True}},
+            {"$group": {"_id": {"month": "$_id.month", "key": FORECAST_GROUPS[group]}, "demand": {"$sum": "$demand"}}}
+        ]
+    return history_from_cells(
+        (cell["_id"]["month"], cell["_id"]["key"], cell["demand"])
+        for cell in db.Assignments.aggregate(cells, batchSize=batch_size)
+    )
+
+
+def _design_matrix(months, seasonal):
+    # Intercept and linear trend, plus month-of-year indicators (January is the baseline)
+    t = np.asarray(months, dtype=np.float64)
+    columns = [np.ones_like(t), t]
+    if seasonal:
+        month_of_year = np.asarray(months) % 12
+        columns += [(month_of_year == m).astype(np.float64) for m in range(1, 12)]
+    return np.column_stack(columns)
+
+
+def forecast_series(history, horizon=12, seasonal=None):
+    # Fit every series at once by closed-form least squares over a shared design matrix
+    # and return only the next horizon months, as (future months, horizon x series matrix)
+    n_months = len(history.months)
+    if n_months == 0:
+        return [], np.zeros((horizon, 0))
+    if seasonal is None:
+        seasonal = n_months >= SEASONAL_MIN_MONTHS
+
+    # Time is counted in calendar months so seasonal indicators line up with real months
+    offset = history.months[0].month - 1
+    X = _design_matrix(np.arange(n_months) + offset, seasonal)
+    coefficients = np.linalg.pinv(X) @ history.counts
+
+    X_future = _design_matrix(np.arange(n_months, n_months + horizon) + offset, seasonal)
+    predicted = np.maximum(X_future @ coefficients, 0.0)
+    future_months = [_add_months(history.months[-1], i + 1) for i in range(horizon)]
+    return future_months, predicted
+
+
+def forecast_from_history(db, demand_model, periods=12):
+    # The time axis and columns are the ones the model was fitted on; only models saved without
+    # them fall back to aggregating the live history
+    n_months = getattr(demand_model, 'n_months_', None)
+    laptop_ids = getattr(demand_model, 'laptop_ids_', None)
+    if n_months is None or laptop_ids is None:
+        history = demand_history(db)
+        n_months = len(history.months) if n_months is None else n_months
+        laptop_ids = history.keys if laptop_ids is None else laptop_ids
+    future_periods = np.arange(n_months + periods).reshape(-1, 1)  # Forecast for 12 periods ahead
+
+    # Predict future demand
+    predicted_demand = np.asarray(demand_model.predict(future_periods)).reshape(len(future_periods), -1)
+    return {str(laptop_id): predicted_demand[:, idx].tolist() for idx, laptop_id in enumerate(laptop_ids[:predicted_demand.shape[1]])}
+
+
+class ForecastCache:
+    # Serves the last computed forecast until the model file or the assignment watermark changes
+
+    def __init__(self, model_cache, compute=forecast_from_history):
+        self.model_cache = model_cache
+        self.compute = compute
+        self.hits = 0
+        self.misses = 0
+        self._key = None
+        self._result = None
+        self._lock = threading.Lock()
+
+    def get(self, db, watermark=None):
+        demand_model = self.model_cache.get()
+        if demand_model is None:
+            return None
+        count, latest = watermark if watermark is not None else assignments_watermark(db)
+        key = (self.model_cache.mtime, count, latest)
+        with self._lock:
+            if key == self._key:
+                self.hits += 1
+                return self._result
+            self.misses += 1
+            forecast = self.compute(db, demand_model)
+            model_modified = datetime.utcfromtimestamp(self.model_cache.mtime / 1e9)
+            self._key = key
+            self._result = ForecastResult(
+                forecast=forecast,
+                etag=hashlib.sha1(repr(key).encode()).hexdigest(),
+                last_modified=max(latest, model_modified) if latest else model_modified
+            )
+            return self._result
+
+
+def forecast_params(args):
+    # (group, horizon) from the query string, or None when neither is given (legacy full-history
+    # output). Raises ValueError with a client-facing message for bad values.
+    if 'group' not in args and 'horizon' not in args:
+        return None
+    group = args.get('group', 'laptop')
+    if group not in FORECAST_GROUPS:
+        raise ValueError(f"group must be one of {', '.join(FORECAST_GROUPS)}")
+    try:
+        horizon = int(args.get('horizon', 12))
+    except (TypeError, ValueError):
+        raise ValueError("horizon must be an integer")
+    if not 1 <= horizon <= MAX_FORECAST_HORIZON:
+        raise ValueError(f"horizon must be between 1 and {MAX_FORECAST_HORIZON}")
+    return group, horizon
+
+
+class GroupedForecastCache:
+    # Grouped, horizon-limited forecasts. The demand history for each grouping level is kept until
+    # the assignment watermark changes; fitting is cheap enough to redo for every horizon.
+
+    def __init__(self, load_history=demand_history):
+        self.load_history = load_history
+        self.hits = 0
+        self.misses = 0
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def get(self, db, group='laptop', horizon=12, watermark=None):
+        count, latest = watermark if watermark is not None else assignments_watermark(db)
+        with self._lock:
+            cached = self._histories.get(group)
+            if cached is not None and cached[0] == (count, latest):
+                self.hits += 1
+                history = cached[1]
+            else:
+                self.misses += 1
+                history = self.load_history(db, group=group)
+                self._histories[group] = ((count, latest), history)
+
+        months, predicted = forecast_series(history, horizon)
+        forecast = {
+            "group": group,
+            "horizon": horizon,
+            "months": [month.strftime('%Y-%m') for month in months],
+            "demandForecast": {key: predicted[:, idx].tolist() for idx, key in enumerate(history.keys)}
+        }
+        return ForecastResult(
+            forecast=forecast,
+            etag=hashlib.sha1(repr((count, latest, group, horizon)).encode()).hexdigest(),
+            last_modified=latest
+        )
@@ -0,0 +1,79 @@
+import numpy as np
+
+DEFAULT_FEATURE_COLUMNS = ['cpu', 'ram', 'storage']
+
+# Code used for categories the label encoders have never seen
+UNKNOWN_CODE = -1
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class FeatureEncoder:
+    # Turns request dicts into model-ready float64 rows using plain dict lookups.
+    # Built once at startup from the pickled label encoders and the model's feature order.
+
+    dtype = np.float64
+
+    def __init__(self, label_encoders, feature_columns=None):
+        self.feature_columns = list(DEFAULT_FEATURE_COLUMNS if feature_columns is None else feature_columns)
+        self.lookups = {
+            column: {cls: code for code, cls in enumerate(le.classes_)}
+            for column, le in label_encoders.items()
+        }
+        self._build_plan()
+
+    def _build_plan(self):
+        # (position, column, lookup) triples, lookup is None for numeric columns
+        self._plan = [
+            (idx, column, self.lookups.get(column))
+            for idx, column in enumerate(self.feature_columns)
+        ]
+
+    @classmethod
+    def from_model(cls, model, label_encoders):
+        return cls(label_encoders, getattr(model, 'feature_names_in_', None))
+
+    @classmethod
+    def from_vocabularies(cls, vocabularies, feature_columns=None):
+        # Build from plain {column: [classes in code order]} vocabularies, as stored in model artifacts
+        encoder = cls({}, feature_columns)
+        encoder.lookups = {
+            column: {value: code for code, value in enumerate(vocab)}
+            for column, vocab in vocabularies.items()
+        }
+        encoder._build_plan()
+        return encoder
+
+    @property
+    def n_features(self):
+        return len(self.feature_columns)
+
+    @property
+    def input_columns(self):
+        # Record fields read by encode; label-encoded features are the fields themselves
+        return self.feature_columns
+
+    def encode(self, record):
+        # Encode a single request dict into a contiguous (1, n_features) row
+        row = np.empty((1, self.n_features), dtype=np.float64)
+        for idx, column, lookup in self._plan:
+            value = record.get(column)
+            row[0, idx] = lookup.get(value, UNKNOWN_CODE) if lookup is not None else _to_float(value)
+        return row
+
+    def encode_many(self, records):
+        # Encode a list of request dicts into a (n_records, n_features) matrix, one column at a time
+        n_records = len(records)
+        encoded = np.empty((n_records, self.n_features), dtype=np.float64)
+        for idx, column, lookup in self._plan:
+            if lookup is not None:
+                values = (lookup.get(record.get(column), UNKNOWN_CODE) for record in records)
+            else:
+                values = (_to_float(record.get(column)) for record in records)
+            encoded[:, idx] = np.fromiter(values, dtype=np.float64, count=n_records)
+        return encoded
@@ -0,0 +1,88 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId
+
+from demand_forecast import history_from_cells
+from spec_features import SPEC_FEATURES, parse_specs_many
+
+# Stores written before specs were parsed (label codes) or without demand cells are rebuilt by a full run
+ENCODING = 'spec-v2'
+
+
+class FeatureStore:
+    # Persisted training rows: parsed numeric specs (cpu_tier, ram_gb, storage_gb, ssd) -> laptopId,
+    # plus the _id of the newest assignment already folded in. Rows are kept unscaled, so every
+    # refit recomputes the standardization without re-parsing any spec strings. Demand is kept
+    # alongside as (month, laptopId, count) cells, so the demand model refits without MongoDB.
+
+    def __init__(self, X=None, y=None, watermark=None, demand_month=None, demand_key=None, demand_count=None):
+        self.feature_columns = list(SPEC_FEATURES)
+        self.X = X if X is not None else np.empty((0, len(self.feature_columns)), dtype=np.float64)
+        self.y = y if y is not None else np.empty(0, dtype=str)
+        self.watermark = watermark
+        # Months are counted as year * 12 + month - 1
+        self.demand_month = demand_month if demand_month is not None else np.empty(0, dtype=np.int64)
+        self.demand_key = demand_key if demand_key is not None else np.empty(0, dtype=str)
+        self.demand_count = demand_count if demand_count is not None else np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.y)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('encoding') != ENCODING:
+                return None
+            return cls(
+                X=data['X'],
+                y=data['y'],
+                watermark=ObjectId(meta['watermark']) if meta['watermark'] else None,
+                demand_month=data['demand_month'],
+                demand_key=data['demand_key'],
+                demand_count=data['demand_count']
+            )
+
+    def save(self, path):
+        meta = {
+            'encoding': ENCODING,
+            'feature_columns': self.feature_columns,
+            'watermark': str(self.watermark) if self.watermark else None
+        }
+        # Write to a temporary file and rename so readers never see a half-written store
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path, X=self.X, y=self.y, meta=np.array(json.dumps(meta)),
+            demand_month=self.demand_month, demand_key=self.demand_key, demand_count=self.demand_count
+        )
+        os.replace(tmp_path, path)
+
+    def append(self, records, laptop_ids, watermark=None):
+        # Parse and append new rows
+        if records:
+            self.X = np.vstack([self.X, parse_specs_many(records)])
+            self.y = np.concatenate([self.y, np.asarray(laptop_ids, dtype=str)])
+        if watermark is not None:
+            self.watermark = watermark
+
+    def add_demand(self, cells):
+        # Fold (month, laptopId, count) cells into the demand history, adding to existing cells
+        totals = dict(zip(zip(self.demand_month.tolist(), self.demand_key.tolist()), self.demand_count.tolist()))
+        for month, key, count in cells:
+            cell = (month.year * 12 + month.month - 1, str(key))
+            totals[cell] = totals.get(cell, 0.0) + float(count)
+        self.demand_month = np.fromiter((month for month, _ in totals), dtype=np.int64, count=len(totals))
+        self.demand_key = np.asarray([key for _, key in totals], dtype=str)
+        self.demand_count = np.fromiter(totals.values(), dtype=np.float64, count=len(totals))
+
+    def demand_history(self):
+        # Month x laptopId demand matrix, as demand_forecast.demand_history builds it from MongoDB
+        return history_from_cells(
+            (datetime(month // 12, month % 12 + 1, 1), key, count)
+            for month, key, count in zip(self.demand_month.tolist(), self.demand_key.tolist(), self.demand_count.tolist())
+        )
@@ -0,0 +1,127 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+from metrics import REGISTRY
+
+REQUEST_SECONDS = REGISTRY.histogram('lamp_request_seconds', "Request latency by endpoint", ('endpoint', 'method', 'status'))
+SPAN_SECONDS = REGISTRY.histogram('lamp_span_seconds', "Time spent in each stage of a request", ('endpoint', 'span'))
+MONGO_COMMAND_SECONDS = REGISTRY.histogram('lamp_mongo_command_seconds', "MongoDB command latency", ('endpoint', 'command', 'collection'))
+MONGO_COMMAND_FAILURES = REGISTRY.counter('lamp_mongo_command_failures_total', "Failed MongoDB commands", ('endpoint', 'command', 'collection'))
+MONGO_COMMANDS_PER_REQUEST = REGISTRY.histogram(
+    'lamp_mongo_commands_per_request', "MongoDB commands issued per request", ('endpoint',),
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+)
+
+
+class RequestContext:
+    __slots__ = ('endpoint', 'started', 'mongo_commands')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.mongo_commands = 0
+
+
+# The request being served on this thread/task; spans and Mongo commands are attributed to it
+_current = contextvars.ContextVar('lamp_request', default=None)
+
+
+def current_endpoint():
+    context = _current.get()
+    return context.endpoint if context is not None else 'background'
+
+
+@contextmanager
+def span(name, endpoint=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_SECONDS.labels(endpoint or current_endpoint(), name).observe(time.perf_counter() - started)
+
+
+def begin_request(endpoint):
+    return _current.set(RequestContext(endpoint))
+
+
+def end_request(token, method, status):
+    context = _current.get()
+    _current.reset(token)
+    if context is None:
+        return
+    REQUEST_SECONDS.labels(context.endpoint, method, status).observe(time.perf_counter() - context.started)
+    MONGO_COMMANDS_PER_REQUEST.labels(context.endpoint).observe(context.mongo_commands)
+
+
+class CommandTimer(monitoring.CommandListener):
+    # Times every MongoDB command. pymongo publishes command events on the thread that ran the
+    # command, so commands issued by a sync request handler are attributed to its endpoint.
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[(event.request_id, event.connection_id)] = collection if isinstance(collection, str) else ''
+
+    def _finish(self, event):
+        collection = self._collections.pop((event.request_id, event.connection_id), '')
+        context = _current.get()
+        if context is not None:
+            context.mongo_commands += 1
+        return (context.endpoint if context is not None else 'background', event.command_name, collection)
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.labels(*self._finish(event)).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        labels = self._finish(event)
+        MONGO_COMMAND_SECONDS.labels(*labels).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(*labels).inc()
+
+
+# Registered globally so it applies to every client created after this module is imported
+command_timer = CommandTimer()
+monitoring.register(command_timer)
+
+
+def endpoint_label(request):
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def instrument_flask(app):
+    from flask import request, g
+
+    @app.before_request
+    def _begin():
+        g.lamp_request_token = begin_request(endpoint_label(request))
+
+    @app.after_request
+    def _end(response):
+        token = g.pop('lamp_request_token', None)
+        if token is not None:
+            end_request(token, request.method, response.status_code)
+        return response
+
+    return app
+
+
+def instrument_quart(app):
+    # Hooks must be coroutines: Quart runs sync hooks on a thread, in a copy of the context
+    from quart import request, g
+
+    @app.before_request
+    async def _begin():
+        g.lamp_request_token = begin_request(endpoint_label(request))
+
+    @app.after_request
+    async def _end(response):
+        token = g.pop('lamp_request_token', None)
+        if token is not None:
+            end_request(token, request.method, response.status_code)
+        return response
+
+    return app
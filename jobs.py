@@ -0,0 +1,265 @@
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from demand_forecast import FORECAST_GROUPS, assignments_watermark
+from metrics import REGISTRY
+
+JOB_SECONDS = REGISTRY.histogram('lamp_job_seconds', "Background job run time", ('job',))
+JOB_FAILURES = REGISTRY.counter('lamp_job_failures_total', "Background job runs that raised", ('job',))
+RESERVATIONS_EXPIRED = REGISTRY.counter('lamp_reservations_expired_total', "Reservations released by the expiry sweep")
+
+
+def acquire_lease(db, name, seconds, owner):
+    # Claim job `name` for `seconds` across every process sharing the database. An expired lease is
+    # taken over in place; a live one makes the upsert collide on _id, so exactly one claimer wins.
+    now = datetime.utcnow()
+    try:
+        db.JobLeases.find_one_and_update(
+            {"_id": name, "expires": {"$lt": now}},
+            {"$set": {"expires": now + timedelta(seconds=seconds), "owner": owner}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+class Job:
+
+    def __init__(self, name, func, interval, exclusive):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.exclusive = exclusive
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started = None
+        self.last_seconds = None
+        self.last_error = None
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "exclusive": self.exclusive,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "lastStarted": self.last_started.isoformat() if self.last_started else None,
+            "lastSeconds": self.last_seconds,
+            "lastError": self.last_error
+        }
+
+
+class JobWorker:
+    # Runs periodic jobs on a small thread pool, off the request path. One scheduler thread sleeps
+    # until the next job is due and hands it to the pool; a job still running when it comes due again
+    # is skipped rather than stacked. Exclusive jobs take a lease in MongoDB first, so with several
+    # worker processes each run happens in only one of them.
+
+    def __init__(self, db, max_workers=2):
+        self.db = db
+        self.max_workers = max_workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs = {}
+        self._heap = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    def add(self, name, func, interval, delay=None, exclusive=False):
+        # Run func every interval seconds, first after delay (default: one interval)
+        job = Job(name, func, interval, exclusive)
+        with self._lock:
+            self.jobs[name] = job
+            heapq.heappush(self._heap, (time.monotonic() + (interval if delay is None else delay), name))
+        self._wake.set()
+        return job
+
+    def start(self):
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='lamp-job')
+        self._thread = threading.Thread(target=self._run, name='job-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def restart_after_fork(self):
+        # Threads do not survive fork: pre-fork workers start their own scheduler and pool
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        for job in self.jobs.values():
+            job.running = False
+        self.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def run_now(self, name):
+        # Run a job immediately on the pool; returns a Future, or None if it is already running
+        return self._submit(self.jobs[name])
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                due_in = self._heap[0][0] - time.monotonic() if self._heap else None
+                if due_in is not None and due_in <= 0:
+                    _, name = heapq.heappop(self._heap)
+                    job = self.jobs[name]
+                    heapq.heappush(self._heap, (time.monotonic() + job.interval, name))
+                else:
+                    job = None
+            if job is not None:
+                if self._submit(job) is None:
+                    job.skipped += 1
+                continue
+            self._wake.wait(due_in)
+            self._wake.clear()
+
+    def _submit(self, job):
+        with self._lock:
+            if job.running:
+                return None
+            job.running = True
+        try:
+            return self._executor.submit(self._execute, job)
+        except RuntimeError:
+            job.running = False
+            return None
+
+    def _execute(self, job):
+        try:
+            # The lease runs a little short of the interval so the next run is never locked out
+            if job.exclusive and not acquire_lease(self.db, job.name, job.interval * 0.9, self.owner):
+                job.skipped += 1
+                return None
+            job.last_started = datetime.utcnow()
+            started = time.perf_counter()
+            try:
+                result = job.func()
+                job.last_error = None
+                return result
+            except Exception as e:
+                job.failures += 1
+                job.last_error = str(e)
+                JOB_FAILURES.labels(job.name).inc()
+                logging.error(f"Background job {job.name} failed: {e}")
+            finally:
+                job.runs += 1
+                job.last_seconds = time.perf_counter() - started
+                JOB_SECONDS.labels(job.name).observe(job.last_seconds)
+        finally:
+            job.running = False
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+
+def _laptop_object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return value
+
+
+def expire_reservations(db, ttl, batch_size=500, on_released=None, now=None):
+    # Release laptops whose reservation is older than ttl, oldest first, batch_size reservations at a
+    # time. Each batch is one indexed (status, reservedDate) query and two unordered bulk writes.
+    # Laptops are freed before their reservations are closed, so a sweep interrupted in between is
+    # simply finished by the next one. on_released gets the laptop _ids of each batch.
+    now = now or datetime.utcnow()
+    cutoff = now - ttl
+    expired = 0
+    while True:
+        batch = list(db.Reservations.find(
+            {"status": "Reserved", "reservedDate": {"$lt": cutoff}},
+            {"laptopId": 1}
+        ).sort("reservedDate", 1).limit(batch_size))
+        if not batch:
+            break
+
+        laptop_ids = list(dict.fromkeys(_laptop_object_id(reservation["laptopId"]) for reservation in batch))
+        db.Laptops.bulk_write([
+            UpdateOne({"_id": laptop_id, "status": "Reserved"}, {"$set": {"status": "Available"}})
+            for laptop_id in laptop_ids
+        ], ordered=False)
+        db.Reservations.bulk_write([
+            UpdateOne({"_id": reservation["_id"], "status": "Reserved"}, {"$set": {"status": "Expired", "expiredDate": now}})
+            for reservation in batch
+        ], ordered=False)
+        if on_released is not None:
+            on_released(laptop_ids)
+
+        expired += len(batch)
+        RESERVATIONS_EXPIRED.labels().inc(len(batch))
+        if len(batch) < batch_size:
+            break
+
+    if expired:
+        logging.info(f"Expired {expired} reservations older than {ttl}.")
+    return expired
+
+
+def retrain_model(model_store):
+    # Fold new assignments into the feature store, refit the recommendation and demand models, and
+    # publish a new artifact. Forecast caches pick the new demand model up by its mtime.
+    import train_model  # pandas/scikit-learn training code, only loaded when the job first runs
+    if train_model.train_incremental() is not None:
+        model_store.reload()
+    elif not os.path.exists(train_model.DEMAND_MODEL_PATH):
+        # Nothing new to fold in, but no demand model was ever fitted (e.g. a fresh deployment)
+        train_model.forecast_laptop_demand()
+
+
+def precompute_forecasts(db, forecast_cache, grouped_forecast_cache, horizon=12):
+    # Refresh the forecast caches. While the assignment history is unchanged this costs two count
+    # queries; after a change, the requests that follow find the new history already loaded.
+    watermark = assignments_watermark(db)
+    forecast_cache.get(db, watermark)
+    for group in FORECAST_GROUPS:
+        grouped_forecast_cache.get(db, group, horizon, watermark)
+
+
+def add_default_jobs(worker, config, model_store, forecast_cache, grouped_forecast_cache, on_released=None, sync_index=None):
+    # Reservation expiry and retraining run in one process at a time; forecast caches and the laptop
+    # index (synced by calling sync_index with the Laptops collection) are per process
+    db = worker.db
+    if config.RESERVATION_SWEEP_INTERVAL > 0:
+        worker.add(
+            'expire_reservations',
+            lambda: expire_reservations(db, timedelta(hours=config.RESERVATION_TTL_HOURS), config.RESERVATION_SWEEP_BATCH, on_released),
+            config.RESERVATION_SWEEP_INTERVAL,
+            delay=0,
+            exclusive=True
+        )
+    if config.RETRAIN_INTERVAL > 0:
+        worker.add('retrain_model', lambda: retrain_model(model_store), config.RETRAIN_INTERVAL, exclusive=True)
+    if config.FORECAST_REFRESH_INTERVAL > 0:
+        worker.add(
+            'precompute_forecasts',
+            lambda: precompute_forecasts(db, forecast_cache, grouped_forecast_cache),
+            config.FORECAST_REFRESH_INTERVAL,
+            delay=0
+        )
+    if config.INDEX_SYNC_INTERVAL > 0 and sync_index is not None:
+        worker.add('sync_laptop_index', lambda: sync_index(db.Laptops), config.INDEX_SYNC_INTERVAL)
+    return worker
@@ -0,0 +1,156 @@
+import threading
+
+import numpy as np
+
+
+def laptop_record(laptop):
+    # Flatten a Laptops document so the encoder sees spec fields next to top-level ones
+    return {**laptop, **(laptop.get('specifications') or {})}
+
+
+class _Partition:
+    # Dense, growable matrix of spec vectors for the laptops in one status
+
+    def __init__(self, n_features, capacity=16, dtype=np.float64):
+        self.vectors = np.empty((capacity, n_features), dtype=dtype)
+        self.ids = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def matrix(self):
+        return self.vectors[:len(self.ids)]
+
+    def add(self, laptop_id, vector):
+        size = len(self.ids)
+        if size == self.vectors.shape[0]:
+            grown = np.empty((size * 2, self.vectors.shape[1]), dtype=self.vectors.dtype)
+            grown[:size] = self.vectors
+            self.vectors = grown
+        self.vectors[size] = vector
+        self.ids.append(laptop_id)
+        self.positions[laptop_id] = size
+
+    def remove(self, laptop_id):
+        # Swap the last row into the freed slot so removal is O(1)
+        position = self.positions.pop(laptop_id)
+        vector = self.vectors[position].copy()
+        last = len(self.ids) - 1
+        if position != last:
+            last_id = self.ids[last]
+            self.vectors[position] = self.vectors[last]
+            self.ids[position] = last_id
+            self.positions[last_id] = position
+        self.ids.pop()
+        return vector
+
+
+class LaptopIndex:
+    # In-memory nearest-neighbour index of laptop spec vectors, partitioned by status.
+    # Kept current incrementally through set_status/upsert, so it never needs a full rebuild.
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self._partitions = {}
+        self._status = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_collection(cls, collection, encoder):
+        index = cls(encoder)
+        projection = {"specifications": 1, "status": 1, **{column: 1 for column in encoder.input_columns}}
+        for laptop in collection.find({}, projection):
+            index.upsert(laptop)
+        return index
+
+    def __len__(self):
+        return len(self._status)
+
+    def _partition(self, status):
+        partition = self._partitions.get(status)
+        if partition is None:
+            partition = self._partitions[status] = _Partition(self.encoder.n_features, dtype=self.encoder.dtype)
+        return partition
+
+    def status_of(self, laptop_id):
+        return self._status.get(laptop_id)
+
+    def count(self, status):
+        partition = self._partitions.get(status)
+        return len(partition) if partition else 0
+
+    def upsert(self, laptop):
+        vector = self.encoder.encode(laptop_record(laptop))[0]
+        with self._lock:
+            laptop_id = laptop["_id"]
+            current = self._status.get(laptop_id)
+            if current is not None:
+                self._partitions[current].remove(laptop_id)
+            status = laptop.get("status")
+            self._partition(status).add(laptop_id, vector)
+            self._status[laptop_id] = status
+
+    def set_status(self, laptop_id, status, expected=None):
+        # Move a laptop between partitions; unknown ids are ignored, as are laptops no longer in
+        # the expected status when one is given
+        with self._lock:
+            current = self._status.get(laptop_id)
+            if current is None or current == status or (expected is not None and current != expected):
+                return
+            vector = self._partitions[current].remove(laptop_id)
+            self._partition(status).add(laptop_id, vector)
+            self._status[laptop_id] = status
+
+    def remove(self, laptop_id):
+        with self._lock:
+            current = self._status.pop(laptop_id, None)
+            if current is not None:
+                self._partitions[current].remove(laptop_id)
+
+    def sync(self, collection):
+        # Reconcile with MongoDB in one {_id, status} scan: statuses changed by other processes,
+        # laptops inserted elsewhere and deleted ones. Returns the number of corrected entries.
+        current = {laptop["_id"]: laptop.get("status") for laptop in collection.find({}, {"status": 1})}
+        with self._lock:
+            known = dict(self._status)
+        corrected = 0
+        for laptop_id, status in current.items():
+            if laptop_id in known and known[laptop_id] != status:
+                # A local claim made since the scan wins over the scanned status
+                self.set_status(laptop_id, status, expected=known[laptop_id])
+                corrected += 1
+        for laptop_id in known:
+            if laptop_id not in current:
+                self.remove(laptop_id)
+                corrected += 1
+        missing = [laptop_id for laptop_id in current if laptop_id not in known]
+        if missing:
+            projection = {"specifications": 1, "status": 1, **{column: 1 for column in self.encoder.input_columns}}
+            for laptop in collection.find({"_id": {"$in": missing}}, projection):
+                self.upsert(laptop)
+                corrected += 1
+        return corrected
+
+    def snapshot(self, status="Available"):
+        # (ids, matrix) copy of one partition, for callers that score every laptop at once
+        with self._lock:
+            partition = self._partitions.get(status)
+            if not partition:
+                return [], np.empty((0, self.encoder.n_features), dtype=self.encoder.dtype)
+            return list(partition.ids), partition.matrix.copy()
+
+    def nearest(self, row, k=5, status="Available"):
+        # Return up to k (laptop_id, distance) pairs with the given status, closest first
+        row = np.asarray(row, dtype=self.encoder.dtype).reshape(-1)
+        with self._lock:
+            partition = self._partitions.get(status)
+            if not partition:
+                return []
+            distances = np.square(partition.matrix - row).sum(axis=1)
+            ids = list(partition.ids)
+        k = min(k, len(ids))
+        closest = np.argpartition(distances, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+        closest = closest[np.argsort(distances[closest], kind='stable')]
+        return [(ids[idx], float(np.sqrt(distances[idx]))) for idx in closest]
@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Page sizes for the keyset-paginated listings
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Documents fetched per cursor round trip when streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+# Projected field names: plain or dotted paths, never operators
+FIELD_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9_]*(\.[A-Za-z][A-Za-z0-9_]*)*$')
+
+
+class Resource:
+    # A listable collection: the query parameters it filters on (parameter -> document field)
+    # and the CSV columns exported when no fields are requested
+
+    def __init__(self, collection, filters, columns):
+        self.collection = collection
+        self.filters = filters
+        self.columns = columns
+
+
+RESOURCES = {
+    'laptops': Resource('Laptops', {'status': 'status', 'location': 'location', 'brand': 'brand'}, [
+        '_id', 'serialNumber', 'model', 'brand', 'specifications.cpu', 'specifications.ram',
+        'specifications.storage', 'specifications.graphics', 'status', 'location', 'age',
+        'condition', 'lastServiced'
+    ]),
+    'assignments': Resource('Assignments', {'status': 'status', 'employeeId': 'employeeId', 'laptopId': 'laptopId'}, [
+        '_id', 'employeeId', 'laptopId', 'assignedDate', 'returnedDate', 'status'
+    ]),
+    'employees': Resource('Employees', {'role': 'role', 'experienceLevel': 'experienceLevel'}, [
+        '_id', 'name', 'role', 'email', 'dateJoined', 'experienceLevel', 'preferences', 'projectNeeds'
+    ]),
+}
+
+
+class ListParams:
+
+    def __init__(self, query, projection, after, limit):
+        self.query = query
+        self.projection = projection
+        self.after = after
+        self.limit = limit
+
+
+def _parse_fields(value):
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    for field in fields:
+        if not FIELD_NAME.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+    # _id is always returned: it is the pagination cursor
+    return dict.fromkeys(['_id'] + fields, 1)
+
+
+def list_params(args, resource):
+    # Parse ?after=&limit=&fields= and the resource's filters from request args.
+    # Raises ValueError for malformed values.
+    query = {}
+    for param, field in resource.filters.items():
+        value = args.get(param)
+        if value:
+            values = [v.strip() for v in value.split(',') if v.strip()]
+            query[field] = values[0] if len(values) == 1 else {"$in": values}
+
+    after = args.get('after')
+    if after:
+        try:
+            after = ObjectId(after)
+        except (InvalidId, TypeError):
+            raise ValueError("after must be an _id returned by a previous page")
+    else:
+        after = None
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    return ListParams(query, _parse_fields(args.get('fields')), after, limit)
+
+
+def fetch_page(collection, params):
+    # One page in _id order, seeking past the cursor on the _id index rather than skipping:
+    # every page costs the same however deep it is. Returns (documents, next cursor or None).
+    query = dict(params.query)
+    if params.after is not None:
+        query["_id"] = {"$gt": params.after}
+    documents = list(collection.find(query, params.projection).sort("_id", 1).limit(params.limit + 1))
+    if len(documents) > params.limit:
+        documents = documents[:params.limit]
+        return documents, documents[-1]["_id"]
+    return documents, None
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    return json.dumps(value, default=_json_default)
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def utilization(db, laptops, now=None):
+    # Usage of a page of laptops from their assignment history, in one query on the laptopId index:
+    # number of assignments, days spent assigned, and the share of days assigned since first use
+    now = now or datetime.utcnow()
+    ids = [str(laptop["_id"]) for laptop in laptops]
+    history = {laptop_id: [] for laptop_id in ids}
+    for assignment in db.Assignments.find(
+        {"laptopId": {"$in": ids}},
+        {"_id": 0, "laptopId": 1, "assignedDate": 1, "returnedDate": 1, "status": 1}
+    ):
+        history[assignment["laptopId"]].append(assignment)
+
+    rows = []
+    for laptop, laptop_id in zip(laptops, ids):
+        assigned_days = 0.0
+        first_assigned = None
+        active = False
+        for assignment in history[laptop_id]:
+            start = _as_datetime(assignment.get("assignedDate"))
+            if start is None:
+                continue
+            end = _as_datetime(assignment.get("returnedDate")) or now
+            active = active or assignment.get("status") == "Active"
+            assigned_days += max((end - start).total_seconds(), 0.0) / 86400.0
+            first_assigned = start if first_assigned is None else min(first_assigned, start)
+        span_days = (now - first_assigned).total_seconds() / 86400.0 if first_assigned else 0.0
+        rows.append({
+            "_id": laptop_id,
+            "serialNumber": laptop.get("serialNumber"),
+            "status": laptop.get("status"),
+            "location": laptop.get("location"),
+            "assignments": len(history[laptop_id]),
+            "active": active,
+            "assignedDays": round(assigned_days, 1),
+            "firstAssigned": first_assigned,
+            "utilization": round(min(assigned_days / span_days, 1.0), 4) if span_days > 0 else 0.0
+        })
+    return rows
+
+
+def _lookup(document, path):
+    for part in path.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    return str(value)
+
+
+def export_rows(collection, params, export_format, columns):
+    # Yield the export one line at a time from a batched cursor, so memory stays constant
+    # however many documents match. _id order lets an interrupted export resume with ?after=.
+    query = dict(params.query)
+    if params.after is not None:
+        query["_id"] = {"$gt": params.after}
+    cursor = collection.find(query, params.projection, batch_size=EXPORT_BATCH_SIZE).sort("_id", 1)
+    try:
+        if export_format == 'ndjson':
+            for document in cursor:
+                yield dumps(document) + '\n'
+        else:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for document in cursor:
+                writer.writerow([_csv_value(_lookup(document, column)) for column in columns])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+            if buffer.tell():
+                yield buffer.getvalue()
+    finally:
+        cursor.close()
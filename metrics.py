@@ -0,0 +1,157 @@
+import bisect
+import threading
+
+
+class Histogram:
+    # Thread-safe fixed-bucket histogram. Buckets are upper bounds; values above the last
+    # bucket land in an implicit +Inf bucket. Quantiles are interpolated within a bucket.
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self.count += 1
+            self.sum += value
+
+    def observe_many(self, values):
+        with self._lock:
+            for value in values:
+                self._counts[bisect.bisect_left(self.buckets, value)] += 1
+                self.count += 1
+                self.sum += value
+
+    def cumulative(self):
+        # (upper bound, cumulative count) pairs, ending with (inf, count)
+        with self._lock:
+            counts = list(self._counts)
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        buckets = self.cumulative()
+        total = buckets[-1][1]
+        if total == 0:
+            return None
+        rank = q * total
+        lower, below = 0.0, 0
+        for bound, cumulative in buckets:
+            if cumulative >= rank:
+                if bound == float('inf'):
+                    return lower
+                inside = cumulative - below
+                return lower + (bound - lower) * ((rank - below) / inside if inside else 0.0)
+            lower, below = bound, cumulative
+        return lower
+
+    def snapshot(self):
+        buckets = self.cumulative()
+        return {
+            "count": buckets[-1][1],
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {("+Inf" if bound == float('inf') else repr(bound)): count for bound, count in buckets}
+        }
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Family:
+    # A named metric with label names; one child Histogram/Counter per label combination
+
+    def __init__(self, name, help_text, kind, labelnames=(), factory=None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def add(self, values, child):
+        self._children[tuple(str(value) for value in values)] = child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            pairs = list(zip(self.labelnames, values))
+            if self.kind == 'histogram':
+                for bound, cumulative in child.cumulative():
+                    lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(child.sum)}")
+                lines.append(f"{self.name}_count{_format_labels(pairs)} {child.count}")
+            else:
+                lines.append(f"{self.name}{_format_labels(pairs)} {_format_value(child.value)}")
+        return lines
+
+
+class Registry:
+    # Metric families exported together in the Prometheus text format
+
+    def __init__(self):
+        self._families = {}
+
+    def histogram(self, name, help_text, labelnames=(), buckets=None):
+        buckets = buckets or LATENCY_BUCKETS
+        return self._families.setdefault(name, Family(name, help_text, 'histogram', labelnames, lambda: Histogram(buckets)))
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._families.setdefault(name, Family(name, help_text, 'counter', labelnames, Counter))
+
+    def add_histogram(self, name, help_text, histogram):
+        # Export an existing unlabelled Histogram, e.g. one owned by the predict batcher
+        family = self._families.setdefault(name, Family(name, help_text, 'histogram'))
+        family.add((), histogram)
+        return family
+
+    def render(self):
+        lines = []
+        for family in self._families.values():
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Process-wide registry served on /metrics
+REGISTRY = Registry()
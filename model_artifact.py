@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from feature_encoder import FeatureEncoder
+from spec_features import SpecEncoder
+
+# Version 1 artifacts carry label-encoder vocabularies; version 2 the spec encoder's scaling
+FORMAT_VERSION = 2
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT'
+
+# What a request needs to make a recommendation; swapped as one object on reload
+ModelArtifact = namedtuple('ModelArtifact', ['version', 'model', 'encoder', 'id_mapping'])
+
+
+class NearestNeighborModel:
+    # Brute-force KNN classifier over memory-mapped training arrays. Predicts like
+    # KNeighborsClassifier(weights='uniform', metric='euclidean') up to the order of equidistant
+    # neighbours, but keeps the training matrix in the page cache where every worker shares it.
+
+    def __init__(self, X, labels, sq_norms, n_classes, n_neighbors, feature_columns):
+        self.X = X
+        self.labels = labels
+        self.sq_norms = sq_norms
+        self.n_classes = n_classes
+        self.n_neighbors = n_neighbors
+        self.feature_names_in_ = np.array(feature_columns, dtype=object)
+
+    def kneighbors(self, X, n_neighbors=None):
+        X = np.asarray(X, dtype=self.X.dtype)
+        k = min(n_neighbors or self.n_neighbors, len(self.labels))
+        # ||a - b||^2 = ||a||^2 - 2ab + ||b||^2, with ||b||^2 precomputed in the artifact
+        distances = np.einsum('ij,ij->i', X, X).astype(np.float64)[:, None] - 2.0 * (X @ self.X.T) + self.sq_norms[None, :]
+        np.maximum(distances, 0, out=distances)
+        neighbors = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < len(self.labels) else np.tile(np.arange(k), (len(X), 1))
+        order = np.argsort(np.take_along_axis(distances, neighbors, axis=1), axis=1, kind='stable')
+        neighbors = np.take_along_axis(neighbors, order, axis=1)
+        return np.sqrt(np.take_along_axis(distances, neighbors, axis=1)), neighbors
+
+    def predict(self, X):
+        _, neighbors = self.kneighbors(X)
+        votes = np.asarray(self.labels)[neighbors]
+        counts = np.zeros((len(votes), self.n_classes), dtype=np.int64)
+        np.add.at(counts, (np.repeat(np.arange(len(votes)), votes.shape[1]), votes.ravel()), 1)
+        # argmax picks the lowest label on ties, like sklearn's uniform-weight vote
+        return counts.argmax(axis=1)
+
+
+def save_artifact(root, X, labels, feature_columns, encoder, laptop_ids, n_neighbors, keep=3):
+    # Write a new artifact version next to the current one, then flip CURRENT atomically
+    os.makedirs(root, exist_ok=True)
+    version = datetime.utcnow().strftime('v%Y%m%dT%H%M%S%fZ')
+    tmp_dir = os.path.join(root, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+
+    # Spec-encoded matrices are float32, halving what every worker maps
+    X = np.ascontiguousarray(X, dtype=getattr(encoder, 'dtype', np.float64))
+    np.save(os.path.join(tmp_dir, 'X.npy'), X)
+    np.save(os.path.join(tmp_dir, 'labels.npy'), np.asarray(labels, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, 'sq_norms.npy'), np.einsum('ij,ij->i', X, X, dtype=np.float64))
+    manifest = {
+        'formatVersion': FORMAT_VERSION,
+        'version': version,
+        'createdAt': datetime.utcnow().isoformat(),
+        'model': 'knn',
+        'nNeighbors': int(n_neighbors),
+        'featureColumns': list(feature_columns),
+        'encoder': encoder.to_dict(),
+        'laptopIds': [str(laptop_id) for laptop_id in laptop_ids]
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), 'w') as file:
+        json.dump(manifest, file)
+    os.rename(tmp_dir, os.path.join(root, version))
+
+    tmp_current = os.path.join(root, f"{CURRENT}.tmp")
+    with open(tmp_current, 'w') as file:
+        file.write(version)
+    os.replace(tmp_current, os.path.join(root, CURRENT))
+
+    # Drop old versions; workers still mapping them keep their pages until they swap
+    versions = sorted(name for name in os.listdir(root) if name.startswith('v'))
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return version
+
+
+def load_artifact(root, version):
+    path = os.path.join(root, version)
+    with open(os.path.join(path, MANIFEST)) as file:
+        manifest = json.load(file)
+    if manifest['formatVersion'] not in (1, FORMAT_VERSION):
+        raise ValueError(f"Unsupported model artifact format {manifest['formatVersion']}")
+
+    model = NearestNeighborModel(
+        X=np.load(os.path.join(path, 'X.npy'), mmap_mode='r'),
+        labels=np.load(os.path.join(path, 'labels.npy'), mmap_mode='r'),
+        sq_norms=np.load(os.path.join(path, 'sq_norms.npy'), mmap_mode='r'),
+        n_classes=len(manifest['laptopIds']),
+        n_neighbors=manifest['nNeighbors'],
+        feature_columns=manifest['featureColumns']
+    )
+    if manifest['formatVersion'] == 1:
+        encoder = FeatureEncoder.from_vocabularies(manifest['vocabularies'], manifest['featureColumns'])
+    else:
+        encoder = SpecEncoder.from_dict(manifest['encoder'])
+    id_mapping = dict(enumerate(manifest['laptopIds']))
+    return ModelArtifact(version=version, model=model, encoder=encoder, id_mapping=id_mapping)
+
+
+def load_pickle(path):
+    # (model, encoder, id_mapping) pickle, used until an artifact has been published. Older pickles
+    # hold a dict of label encoders in place of the encoder.
+    with open(path, 'rb') as file:
+        model, encoder, id_mapping = pickle.load(file)
+    if isinstance(encoder, dict):
+        encoder = FeatureEncoder.from_model(model, encoder)
+    return ModelArtifact(version='pickle', model=model, encoder=encoder, id_mapping=id_mapping)
+
+
+def read_current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT)) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ModelStore:
+    # Holds the live ModelArtifact. Requests take current() once and use that object
+    # throughout, so a reload swaps in the new version without disturbing in-flight requests.
+
+    def __init__(self, root, on_swap=None):
+        self.root = root
+        self.on_swap = on_swap
+        self._current = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._interval = None
+
+    def current(self):
+        return self._current
+
+    def set(self, artifact):
+        with self._lock:
+            self._current = artifact
+        if self.on_swap is not None:
+            self.on_swap(artifact)
+
+    def reload(self):
+        # Load the version named by CURRENT if it differs from the live one; True if swapped
+        version = read_current_version(self.root)
+        if version is None or (self._current is not None and self._current.version == version):
+            return False
+        self.set(load_artifact(self.root, version))
+        logging.info(f"Loaded model artifact {version}")
+        return True
+
+    def watch(self, interval=5.0):
+        self._interval = interval
+        stop = self._stop
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    logging.error(f"Error reloading model artifact: {e}")
+        self._thread = threading.Thread(target=run, name='model-artifact-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def restart_after_fork(self):
+        # Threads do not survive fork: pre-fork workers start their own watcher, so each one
+        # picks up artifacts published after the fork (e.g. by another worker's retraining job)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if self._interval is not None:
+            self.watch(self._interval)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,162 @@
+import math
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Request/laptop fields the specs are parsed from, and the numeric features they become
+SPEC_INPUT_COLUMNS = ['cpu', 'ram', 'storage']
+SPEC_FEATURES = ['cpu_tier', 'ram_gb', 'storage_gb', 'ssd']
+
+# CPU families by performance tier; Apple silicon is handled by _apple_tier
+CPU_TIERS = [
+    (re.compile(r'\bi3\b|ryzen 3\b|celeron|pentium|athlon'), 1.0),
+    (re.compile(r'\bi5\b|ryzen 5\b'), 2.0),
+    (re.compile(r'\bi7\b|ryzen 7\b'), 3.0),
+    (re.compile(r'\bi9\b|ryzen 9\b|threadripper|xeon'), 4.0),
+]
+APPLE_CPU = re.compile(r'\bm(\d+)(?:\s+(pro|max|ultra))?\b')
+APPLE_VARIANT_BONUS = {None: 0.0, 'pro': 0.5, 'max': 1.0, 'ultra': 1.5}
+
+CAPACITY = re.compile(r'(\d+(?:\.\d+)?)\s*(tb|gb|mb)?')
+CAPACITY_UNITS_GB = {'tb': 1024.0, 'gb': 1.0, 'mb': 1.0 / 1024.0, None: 1.0}
+
+
+def _apple_tier(cpu):
+    match = APPLE_CPU.search(cpu)
+    if not match:
+        return None
+    # M1 sits with i7/Ryzen 7; each generation and Pro/Max/Ultra variant moves it up
+    return 3.0 + 0.25 * (int(match.group(1)) - 1) + APPLE_VARIANT_BONUS[match.group(2)]
+
+
+@lru_cache(maxsize=1024)
+def cpu_tier(cpu):
+    # Performance tier of a CPU name, e.g. "Intel Core i7" -> 3.0; nan if unrecognised
+    if not isinstance(cpu, str):
+        return math.nan
+    cpu = cpu.lower()
+    if 'apple' in cpu:
+        tier = _apple_tier(cpu)
+        if tier is not None:
+            return tier
+    for pattern, tier in CPU_TIERS:
+        if pattern.search(cpu):
+            return tier
+    return math.nan
+
+
+@lru_cache(maxsize=1024)
+def capacity_gb(value):
+    # "16GB" -> 16.0, "1TB SSD" -> 1024.0, 16 -> 16.0; nan if there is no number
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return math.nan
+    match = CAPACITY.search(value.lower())
+    if not match:
+        return math.nan
+    return float(match.group(1)) * CAPACITY_UNITS_GB[match.group(2)]
+
+
+@lru_cache(maxsize=1024)
+def is_ssd(storage):
+    # 1.0 for SSD/NVMe/flash storage, 0.0 for HDD, nan if the type is not stated
+    if not isinstance(storage, str):
+        return math.nan
+    storage = storage.lower()
+    if 'ssd' in storage or 'nvme' in storage or 'flash' in storage:
+        return 1.0
+    if 'hdd' in storage or 'rpm' in storage:
+        return 0.0
+    return math.nan
+
+
+def _hashable(value):
+    return value if isinstance(value, (str, int, float, type(None))) else str(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse(cpu, ram, storage):
+    return (cpu_tier(cpu), capacity_gb(ram), capacity_gb(storage), is_ssd(storage))
+
+
+def parse_specs(record):
+    # Raw numeric specs (cpu_tier, ram_gb, storage_gb, ssd) of a request or flattened laptop record.
+    # Cached per distinct (cpu, ram, storage), so repeated specs are never re-parsed.
+    return _parse(_hashable(record.get('cpu')), _hashable(record.get('ram')), _hashable(record.get('storage')))
+
+
+def parse_specs_many(records):
+    return np.array([parse_specs(record) for record in records], dtype=np.float64).reshape(-1, len(SPEC_FEATURES))
+
+
+class SpecEncoder:
+    # Maps parsed specs into a standardized float32 space where Euclidean distance is meaningful:
+    # capacities on a log2 scale (8 -> 16GB is as far as 16 -> 32GB), every feature centred and
+    # scaled by its training spread. Missing values land on the training mean.
+
+    dtype = np.float32
+
+    # Encoded rows are kept per distinct parsed spec, up to this many
+    ROW_CACHE_SIZE = 4096
+
+    def __init__(self, mean, scale):
+        self.feature_columns = list(SPEC_FEATURES)
+        self.input_columns = list(SPEC_INPUT_COLUMNS)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self._rows = {}
+
+    @property
+    def n_features(self):
+        return len(self.feature_columns)
+
+    @staticmethod
+    def _log_capacities(raw):
+        transformed = np.array(raw, dtype=np.float64, copy=True).reshape(-1, len(SPEC_FEATURES))
+        transformed[:, 1:3] = np.log2(np.maximum(transformed[:, 1:3], 1.0 / 1024.0))
+        return transformed
+
+    @classmethod
+    def fit(cls, raw):
+        # Standardization parameters from raw parsed training rows
+        transformed = cls._log_capacities(raw)
+        mean = np.nanmean(transformed, axis=0) if len(transformed) else np.zeros(len(SPEC_FEATURES))
+        scale = np.nanstd(transformed, axis=0) if len(transformed) else np.ones(len(SPEC_FEATURES))
+        mean = np.where(np.isnan(mean), 0.0, mean)
+        scale = np.where(np.isnan(scale) | (scale < 1e-9), 1.0, scale)
+        return cls(mean, scale)
+
+    def transform(self, raw):
+        scaled = (self._log_capacities(raw) - self.mean) / self.scale
+        return np.nan_to_num(scaled, nan=0.0).astype(self.dtype)
+
+    def encode(self, record):
+        # Read-only (1, n_features) row, shared between calls with the same specs
+        raw = parse_specs(record)
+        row = self._rows.get(raw)
+        if row is None:
+            row = self.transform(np.array([raw], dtype=np.float64))
+            row.setflags(write=False)
+            if len(self._rows) < self.ROW_CACHE_SIZE:
+                self._rows[raw] = row
+        return row
+
+    def encode_many(self, records):
+        return self.transform(parse_specs_many(records))
+
+    def to_dict(self):
+        return {'type': 'spec', 'features': self.feature_columns, 'mean': self.mean.tolist(), 'scale': self.scale.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['mean'], data['scale'])
+
+    def __getstate__(self):
+        # Pickled without the row cache
+        return {key: value for key, value in self.__dict__.items() if key != '_rows'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._rows = {}
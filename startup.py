@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+
+
+class NotReady(Exception):
+    # Raised to requests for a component that is loading elsewhere or failed recently
+    pass
+
+
+class Component:
+
+    def __init__(self, name, loader, requires):
+        self.name = name
+        self.loader = loader
+        self.requires = tuple(requires)
+        self.ready = False
+        self.error = None
+        self.seconds = None
+        self.failed_at = None
+        self.lock = threading.Lock()
+
+    def status(self):
+        return {"ready": self.ready, "error": self.error, "seconds": self.seconds}
+
+
+class Warmup:
+    # Lazily initialised parts of the app (database, model, laptop index, ...). Each is loaded once,
+    # by whichever comes first: the background warm-up or a request that needs it. Requests never
+    # wait on a load: while one is in progress, while the warm-up is retrying, or within retry_after
+    # seconds of a failure they get NotReady at once, so an outage cannot queue them behind timeouts.
+
+    def __init__(self, retry_after=5.0):
+        self.retry_after = retry_after
+        self.components = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._backoff = None
+
+    def register(self, name, loader, requires=()):
+        self.components[name] = Component(name, loader, requires)
+
+    def ensure(self, *names, wait=True):
+        # Load the named components and their requirements; raises the loader's error on failure.
+        # With wait=False (requests) raises NotReady instead of loading whenever the load would block
+        # or repeat a recent failure; retries are then left to the warm-up thread.
+        for name in names:
+            component = self.components[name]
+            if component.ready:
+                continue
+            self.ensure(*component.requires, wait=wait)
+            if not wait:
+                if self._thread is not None and self._thread.is_alive():
+                    raise NotReady(f"{name} is loading" + (f" (last error: {component.error})" if component.error else ""))
+                if component.failed_at is not None and time.monotonic() - component.failed_at < self.retry_after:
+                    raise NotReady(f"{name} failed to load: {component.error}")
+            if not component.lock.acquire(blocking=wait):
+                raise NotReady(f"{name} is loading")
+            try:
+                if component.ready:
+                    continue
+                started = time.perf_counter()
+                try:
+                    component.loader()
+                except Exception as e:
+                    component.error = str(e)
+                    component.failed_at = time.monotonic()
+                    raise
+                component.seconds = round(time.perf_counter() - started, 3)
+                component.error = None
+                component.failed_at = None
+                component.ready = True
+                logging.info(f"Startup: {name} ready in {component.seconds:.2f}s")
+            finally:
+                component.lock.release()
+
+    def is_ready(self, *names):
+        return all(self.components[name].ready for name in names or self.components)
+
+    def status(self):
+        return {name: component.status() for name, component in self.components.items()}
+
+    def start(self, backoff=0.5, max_backoff=30.0):
+        # Warm every component on a background thread, retrying with exponential backoff. Components
+        # are tried independently, so the model is loaded even while the database is unreachable.
+        self._backoff = (backoff, max_backoff)
+        stop = self._stop
+
+        def run():
+            delay = backoff
+            while not stop.is_set():
+                failed = []
+                for name in self.components:
+                    try:
+                        self.ensure(name)
+                    except Exception as e:
+                        failed.append(f"{name}: {e}")
+                if not failed:
+                    return
+                logging.warning(f"Startup incomplete, retrying in {delay:.1f}s: {'; '.join(failed)}")
+                if stop.wait(delay):
+                    return
+                delay = min(delay * 2, max_backoff)
+
+        self._thread = threading.Thread(target=run, name='startup-warmup', daemon=True)
+        self._thread.start()
+        return self
+
+    def restart_after_fork(self):
+        # Threads do not survive fork: a loader running in the parent at fork time leaves its lock held
+        # and its component unloaded in the child. Pre-fork workers get fresh locks and, if the parent
+        # was warming up, their own warm-up thread to finish whatever was not ready.
+        for component in self.components.values():
+            component.lock = threading.Lock()
+        stopped = self._stop.is_set()
+        self._stop = threading.Event()
+        self._thread = None
+        if self._backoff is not None and not stopped:
+            self.start(*self._backoff)
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.is_ready()
+
+    def stop(self):
+        self._stop.set()
@@ -1,3 +1,4 @@
+import argparse
 import pandas as pd
 import pickle
 from sklearn.neighbors import KNeighborsClassifier
@@ -5,72 +6,158 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.linear_model import LinearRegression
 from bson import ObjectId
+from bson.errors import InvalidId
 from config import get_db
+from demand_forecast import _as_datetime, demand_history
+from feature_store import FeatureStore
+from model_artifact import save_artifact, load_pickle
+from spec_features import SpecEncoder
+import config
 import numpy as np
-# Connect to MongoDB
-db = get_db()
-
-# Fetch data from MongoDB
-assignments = list(db.Assignments.find({"status": "Active"}))
-employees = list(db.Employees.find())
-laptops = list(db.Laptops.find())
-
-# Convert to DataFrames
-assignment_df = pd.DataFrame(assignments)
-employee_df = pd.DataFrame(employees)
-laptop_df = pd.DataFrame(laptops)
-
-# Flatten the specifications dictionary in laptop_df
-specs_df = laptop_df['specifications'].apply(pd.Series)
-laptop_df = pd.concat([laptop_df.drop(columns=['specifications']), specs_df], axis=1)
-
-# Merge DataFrames
-assignment_df['employeeId'] = assignment_df['employeeId'].astype(str)
-employee_df['_id'] = employee_df['_id'].astype(str)
-
-merged_df = assignment_df.merge(employee_df, left_on='employeeId', right_on='_id')
-
-# Add laptop details to the merged DataFrame
-laptop_df['_id'] = laptop_df['_id'].astype(str)
-merged_df = merged_df.merge(laptop_df, left_on='laptopId', right_on='_id', suffixes=('_employee', '_laptop'))
-
-# Prepare the data for training
-X = merged_df[['cpu', 'ram', 'storage']]  # Ensure the features are correct
-y = merged_df['laptopId']
-
-# Encode categorical data
-label_encoders = {}
-for column in X.select_dtypes(include=['object']).columns:
-    le = LabelEncoder()
-    X[column] = le.fit_transform(X[column])
-    label_encoders[column] = le
-
-# Encode the target variable
-le_target = LabelEncoder()
-y = le_target.fit_transform(y)
 
-# Map integers back to ObjectIds
-id_mapping = dict(zip(le_target.transform(le_target.classes_), le_target.classes_))
+MODEL_PATH = 'laptop_recommendation_model.pkl'
+DEMAND_MODEL_PATH = 'laptop_demand_model.pkl'
+FEATURE_STORE_PATH = 'laptop_feature_store.npz'
+FEATURE_COLUMNS = ['cpu', 'ram', 'storage']
 
-# Split the data
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+# Connect to MongoDB
+db = get_db()
 
-# Train the model
-model = KNeighborsClassifier(n_neighbors=3)
-model.fit(X_train, y_train)
+def _object_ids(values):
+    # Ids are stored as strings on assignments; match ObjectId _ids and plain string _ids alike
+    ids = []
+    for value in values:
+        try:
+            ids.append(ObjectId(value))
+        except (InvalidId, TypeError):
+            ids.append(value)
+    return ids
 
-# Save the model, label encoders, and id mapping
-with open('laptop_recommendation_model.pkl', 'wb') as file:
-    pickle.dump((model, label_encoders, id_mapping), file)
+# Fit the recommendation model on every row in the feature store and save it
+def fit_recommendation_model(store):
+    # Standardize the parsed specs so KNN distances compare like with like
+    encoder = SpecEncoder.fit(store.X)
+    X = pd.DataFrame(encoder.transform(store.X), columns=encoder.feature_columns)
+    
+    # Encode the target variable
+    le_target = LabelEncoder()
+    y = le_target.fit_transform(store.y)
+    
+    # Map integers back to ObjectIds
+    id_mapping = dict(zip(le_target.transform(le_target.classes_), le_target.classes_))
+    
+    # Split the data
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    
+    # Train the model
+    model = KNeighborsClassifier(n_neighbors=3)
+    model.fit(X_train, y_train)
+    
+    # Save the model, spec encoder, and id mapping
+    with open(MODEL_PATH, 'wb') as file:
+        pickle.dump((model, encoder, id_mapping), file)
+    
+    # Publish the memory-mappable artifact that running API workers hot-reload
+    version = save_artifact(
+        config.MODEL_ARTIFACT_DIR,
+        X_train.to_numpy(dtype=np.float32),
+        y_train,
+        encoder.feature_columns,
+        encoder,
+        le_target.classes_,
+        model.n_neighbors
+    )
+    
+    print(f"Model trained and saved successfully (artifact {version}).")
+    return model
 
-print("Model trained and saved successfully.")
+# Rebuild the feature store from the full assignment history and train from scratch
+def train_full():
+    # Fetch data from MongoDB
+    assignments = list(db.Assignments.find({"status": "Active"}))
+    employees = list(db.Employees.find())
+    laptops = list(db.Laptops.find())
+    
+    # Convert to DataFrames
+    assignment_df = pd.DataFrame(assignments)
+    employee_df = pd.DataFrame(employees)
+    laptop_df = pd.DataFrame(laptops)
+    
+    # Flatten the specifications dictionary in laptop_df
+    specs_df = laptop_df['specifications'].apply(pd.Series)
+    laptop_df = pd.concat([laptop_df.drop(columns=['specifications']), specs_df], axis=1)
+    
+    # Merge DataFrames
+    assignment_df['employeeId'] = assignment_df['employeeId'].astype(str)
+    employee_df['_id'] = employee_df['_id'].astype(str)
+    
+    merged_df = assignment_df.merge(employee_df, left_on='employeeId', right_on='_id')
+    
+    # Add laptop details to the merged DataFrame
+    laptop_df['_id'] = laptop_df['_id'].astype(str)
+    merged_df = merged_df.merge(laptop_df, left_on='laptopId', right_on='_id', suffixes=('_employee', '_laptop'))
+    
+    # Parse the spec strings into numeric training rows
+    X = merged_df[FEATURE_COLUMNS]
+    store = FeatureStore()
+    store.append(X.to_dict('records'), merged_df['laptopId'].tolist(), watermark=max((a['_id'] for a in assignments), default=None))
+    
+    # Seed the demand cells from the month x laptopId counts aggregated inside MongoDB
+    history = demand_history(db)
+    rows, columns = np.nonzero(history.counts)
+    store.add_demand((history.months[row], history.keys[column], history.counts[row, column]) for row, column in zip(rows, columns))
+    store.save(FEATURE_STORE_PATH)
+    
+    model = fit_recommendation_model(store)
+    forecast_laptop_demand(store)
+    return model
 
-# Load the model, label encoders, and id mapping
-with open('laptop_recommendation_model.pkl', 'rb') as file:
-    model, label_encoders, id_mapping = pickle.load(file)
+# Fold only assignments newer than the feature store watermark into the store and refit
+def train_incremental():
+    store = FeatureStore.load(FEATURE_STORE_PATH)
+    if store is None:
+        print("No compatible feature store found, running a full training.")
+        return train_full()
+    
+    # Fetch only the assignments added since the last run
+    query = {"status": "Active"}
+    if store.watermark is not None:
+        query["_id"] = {"$gt": store.watermark}
+    new_assignments = list(db.Assignments.find(query, {"employeeId": 1, "laptopId": 1, "assignedDate": 1}).sort("_id", 1))
+    if not new_assignments:
+        print("No new assignments since the last training run.")
+        return None
+    
+    # Look up just the employees and laptops those assignments reference
+    employee_ids = {str(employee['_id']) for employee in db.Employees.find(
+        {"_id": {"$in": _object_ids({a['employeeId'] for a in new_assignments})}}, {"_id": 1})}
+    laptop_specs = {str(laptop['_id']): laptop.get('specifications') or {} for laptop in db.Laptops.find(
+        {"_id": {"$in": _object_ids({a['laptopId'] for a in new_assignments})}}, {"specifications": 1})}
+    
+    records = []
+    laptop_ids = []
+    for assignment in new_assignments:
+        if str(assignment['employeeId']) in employee_ids and assignment['laptopId'] in laptop_specs:
+            records.append(laptop_specs[assignment['laptopId']])
+            laptop_ids.append(assignment['laptopId'])
+    
+    store.append(records, laptop_ids, watermark=new_assignments[-1]['_id'])
+    
+    # Every dated assignment counts towards demand in its month, as in demand_history
+    assigned_dates = [(_as_datetime(a.get('assignedDate')), a['laptopId']) for a in new_assignments if a.get('assignedDate') is not None]
+    store.add_demand((assigned, laptop_id, 1) for assigned, laptop_id in assigned_dates if assigned is not None)
+    store.save(FEATURE_STORE_PATH)
+    print(f"Added {len(records)} new training rows ({len(store)} total).")
+    
+    model = fit_recommendation_model(store)
+    forecast_laptop_demand(store)
+    return model
 
 # Function to recommend and assign a laptop for a new hire
 def onboard_new_hire(new_employee):
+    current = load_pickle(MODEL_PATH)
+    model, encoder, id_mapping = current.model, current.encoder, current.id_mapping
+    
     # Extract relevant details for prediction
     employee_details = {
         'cpu': new_employee['cpu'],
@@ -78,15 +165,8 @@ def onboard_new_hire(new_employee):
         'storage': new_employee['storage']
     }
     
-    # Encode the details
-    for column, le in label_encoders.items():
-        employee_details[column] = le.transform([employee_details[column]])[0]
-    
-    # Convert to DataFrame
-    employee_df = pd.DataFrame([employee_details])
-    
     # Predict the laptop
-    predicted_laptop_idx = model.predict(employee_df)[0]
+    predicted_laptop_idx = model.predict(encoder.encode(employee_details))[0]
     predicted_laptop_id = id_mapping[predicted_laptop_idx]
     
     # Check the availability of the recommended laptop
@@ -127,27 +207,27 @@ def offboard_employee(employee_id):
     print(f"Offboarding process completed for employee {employee_id}.")
 
 # Function to forecast laptop demand
-def forecast_laptop_demand():
-    # Fetch historical assignment data
-    historical_data = list(db.Assignments.find({"status": "Active"}))
-    historical_df = pd.DataFrame(historical_data)
-    
-    # Feature engineering for demand forecasting
-    historical_df['assignedDate'] = pd.to_datetime(historical_df['assignedDate'])
-    historical_df['month'] = historical_df['assignedDate'].dt.to_period('M')
-    demand_df = historical_df.groupby(['month', 'laptopId']).size().reset_index(name='demand')
-    
-    # Pivot the data for modeling
-    demand_pivot = demand_df.pivot(index='month', columns='laptopId', values='demand').fillna(0)
+def forecast_laptop_demand(store=None):
+    # Month x laptopId demand counts from the feature store, or aggregated inside MongoDB without one
+    if store is None:
+        store = FeatureStore.load(FEATURE_STORE_PATH)
+    history = store.demand_history() if store is not None else demand_history(db)
+    if not history.months:
+        print("No active assignments to train the demand forecasting model on.")
+        return
     
     # Train a Linear Regression model to forecast demand
-    X_demand = np.arange(len(demand_pivot)).reshape(-1, 1)  # Time index
-    y_demand = demand_pivot.values
+    X_demand = np.arange(len(history.months)).reshape(-1, 1)  # Time index
+    y_demand = history.counts
     demand_model = LinearRegression()
     demand_model.fit(X_demand, y_demand)
     
+    # Remember the laptop behind each output column and how many history months the model covers
+    demand_model.laptop_ids_ = history.keys
+    demand_model.n_months_ = len(history.months)
+    
     # Save the demand forecasting model
-    with open('laptop_demand_model.pkl', 'wb') as file:
+    with open(DEMAND_MODEL_PATH, 'wb') as file:
         pickle.dump(demand_model, file)
     
     print("Demand forecasting model trained and saved successfully.")
@@ -155,7 +235,7 @@ def forecast_laptop_demand():
 # Load the demand forecasting model
 def load_demand_model():
     try:
-        with open('laptop_demand_model.pkl', 'rb') as file:
+        with open(DEMAND_MODEL_PATH, 'rb') as file:
             demand_model = pickle.load(file)
         return demand_model
     except Exception as e:
@@ -169,17 +249,26 @@ def predict_laptop_demand(periods=12):
         return {"error": "Demand forecasting model not available."}
     
     # Generate future periods
-    future_periods = np.arange(len(demand_model.coef_[0]) + periods).reshape(-1, 1)
+    future_periods = np.arange(demand_model.n_months_ + periods).reshape(-1, 1)
     
     # Predict future demand
-    predicted_demand = demand_model.predict(future_periods)
+    predicted_demand = demand_model.predict(future_periods).reshape(len(future_periods), -1)
     
     # Prepare results
     demand_forecast = {}
-    for idx, laptop_id in enumerate(demand_model.coef_[0].keys()):
+    for idx, laptop_id in enumerate(demand_model.laptop_ids_):
         demand_forecast[str(laptop_id)] = predicted_demand[:, idx].tolist()
     
     return demand_forecast
 
 if __name__ == "__main__":
-    forecast_laptop_demand()
+    parser = argparse.ArgumentParser(description="Train the laptop recommendation and demand forecasting models")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only fold in assignments newer than the feature store watermark instead of retraining from scratch")
+    args = parser.parse_args()
+    
+    # Both refit the demand forecasting model from the feature store as well
+    if args.incremental:
+        train_incremental()
+    else:
+        train_full()